@@ -10,21 +10,25 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import with_statement
 import argparse
-import numpy as np
-import pandas as pd
-import re
-from os.path import expanduser
-from getpass import getuser
-from glob import glob
+import apexlogd
+import time
 
+SKIP_SOURCES = ['PARK', 'ZENITH', 'RECYCLE', 'RECYCLING']
+SUMMARY_COLUMNS = ['scan_status', 'source', 'mol_line', 'scan_duration']
 
-def read_one_log(filename):
-    '''Read a html obslog to pandas DataFrame
+
+def read_obslogs(dir=None, **kwargs):
+    '''Read APEX html obslogs
+
+    Uses apexlog.read_obslogs (and its parse cache), also skipping
+    recycling and 'Shutter closed' scans.
 
     Parameters
     ----------
-    filename : string
-        obslog html file
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    **kwargs
+        Passed on to apexlog.read_obslogs, e.g. cache, rebuild, jobs
 
     Returns
     -------
@@ -32,54 +36,23 @@ def read_one_log(filename):
         The obslog data
     '''
 
-    print('Reading obslog:', filename)
-    df = pd.read_html(filename, header=0)[0]
-    df['UTC'] = pd.to_datetime(df.UTC, format='%Y-%m-%dU%H:%M:%S')
-    cancelled = df[df['Scan duration'] == -999]
-    df.loc[cancelled.index, 'Scan duration'] = 0
-    df['Scan duration'] = pd.to_timedelta(df['Scan duration'], unit='s')
-    df['mm PWV'] = df[['mm PWV']].astype(str)
-    df.drop(df[df.Source.isin(['PARK', 'ZENITH', 'RECYCLE', 'RECYCLING']) |
-               (df['mm PWV'] == 'Shutter closed')].index, inplace=True)
-    df['mm PWV'] = df[['mm PWV']].apply(pd.to_numeric)
-    return df
+    import apexlog
+    return apexlog.read_obslogs(dir, exclude=SKIP_SOURCES, drop_closed=True,
+                                **kwargs)
 
 
-def get_line_name(string):
-    '''Get first white spaced delimited part of string'''
-    return string.split()[0]
+def iter_obslogs(dir=None, **kwargs):
+    '''Iterate over APEX html obslogs, see read_obslogs
 
-
-def read_obslogs(dir=None):
-    '''Read APEX html obslogs
-
-    Parameters
-    ----------
-    dir : string (optional)
-        Directory with html log files, defaults to ~/obslogs/
-
-    Returns
-    -------
+    Yields
+    ------
     df : pandas.DataFrame
-        The obslog data
+        The data of one obslog
     '''
 
-    if dir is None:
-        dir = expanduser('~/obslogs/')
-    logs = glob(dir + '*.html')
-
-    print('')
-    df = read_one_log(logs[0])
-    for log in logs[1:]:
-        df = pd.concat([df, read_one_log(log)], axis=0)
-    df['Line'] = df['Mol. line'].apply(lambda x: x.split()[0])
-    df.rename(columns=(lambda x: re.sub('[().]', '', x)), inplace=True)
-    df.rename(columns=(lambda x: re.sub('[ -]', '_', x)), inplace=True)
-    df.rename(columns=(lambda x: x.lower()), inplace=True)
-    df.set_index('utc', inplace=True)
-    df.sort_index(inplace=True)
-    df.reset_index(inplace=True)
-    return df
+    import apexlog
+    return apexlog.iter_obslogs(dir, exclude=SKIP_SOURCES, drop_closed=True,
+                                **kwargs)
 
 
 def parse_inputs():
@@ -87,19 +60,105 @@ def parse_inputs():
     parser = argparse.ArgumentParser(description='Summarises APEX html obslogs')
     parser.add_argument('-s', '--source', type=str,
                         help='Source name')
+    parser.add_argument('--since', type=str, metavar='UTC',
+                        help='Only scans since UTC (date or date/time)')
+    parser.add_argument('--until', type=str, metavar='UTC',
+                        help='Only scans before UTC (date or date/time)')
+    parser.add_argument('--night', type=str, metavar='DATE',
+                        help='Only scans of the night starting on DATE '
+                             '(12:00 to 12:00 UTC)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the obslog parse cache')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Re-parse all obslogs and rebuild the cache')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Parse obslogs in N processes, 0 for all CPUs')
+    parser.add_argument('--parser', choices=['fast', 'pandas'],
+                        default='fast',
+                        help='obslog table parser, defaults to fast')
+    parser.add_argument('--compact', action='store_true',
+                        help='Use categorical/float32 columns')
+    parser.add_argument('--stream', action='store_true',
+                        help='Sum one obslog at a time, without keeping df')
+    parser.add_argument('-w', '--watch', type=float, nargs='?', const=10.,
+                        metavar='SECONDS',
+                        help='Update the summary as scans arrive')
+    parser.add_argument('--profile', type=str, nargs='?', const='-',
+                        metavar='JSON',
+                        help='Print time/memory per stage, or write JSON')
+    parser.add_argument('--profile-dump', type=str, metavar='FILE',
+                        help='Write cProfile stats of the slowest stage')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run the resident summary daemon')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='Do not ask a running summary daemon')
     args = parser.parse_args()
-    return args.source
+    return args
 
 
 def main():
-    source = parse_inputs()
-    df = read_obslogs(dir=None)
+    args = parse_inputs()
+    source = args.source
+    if args.daemon:
+        apexlogd.serve(exclude=SKIP_SOURCES, drop_closed=True,
+                       parser=args.parser, columns=SUMMARY_COLUMNS)
+        return None, None
+    if not (args.no_daemon or args.no_cache or args.rebuild_cache or
+            args.stream or args.watch or args.profile or args.profile_dump or
+            args.since or args.until or args.night):
+        answer = apexlogd.query(source=source)
+        if answer is not None:
+            print(answer['text'])
+            return None, None
+
+    # pandas is only imported when not answered by the daemon
+    import apexlog
+    read_kw = dict(cache=not args.no_cache, rebuild=args.rebuild_cache,
+                   jobs=args.jobs, parser=args.parser,
+                   columns=SUMMARY_COLUMNS)
+    since, until = apexlog.time_range(args.since, args.until, args.night)
+    if since is not None or until is not None:
+        read_kw.update(since=since, until=until)
     if source is None:
-        dfs = df.groupby(['scan_status', 'source', 'line'])[['scan_duration']].sum()
+        by = ['scan_status', 'source', 'line']
     else:
-        dfs = df[df.source == source].groupby(['scan_status', 'line'])[['scan_duration']].sum()
-    
+        # only scans of source are kept
+        by = ['scan_status', 'line']
+        read_kw['sources'] = [source]
+
+    if args.watch:
+        summary = apexlog.ObslogSummary(None, by, since=since, until=until,
+                                        exclude=SKIP_SOURCES,
+                                        drop_closed=True, parser=args.parser,
+                                        sources=read_kw.get('sources'),
+                                        columns=SUMMARY_COLUMNS)
+
+        def show(summary):
+            print('\n' + time.strftime('%Y-%m-%d %H:%M:%S'))
+            print(summary.total())
+
+        summary.watch(show, args.watch)
+        return None, summary.total()
+
+    if 'since' in read_kw and not apexlog.find_obslogs(None, since, until):
+        print('No obslogs from', since, 'to', until)
+        return None, None
+    profile = None
+    if args.profile or args.profile_dump:
+        profile = apexlog.StageProfile(cprofile=bool(args.profile_dump))
+        read_kw['profile'] = profile
+    if args.stream:
+        df = None
+        with apexlog.profile_stage(profile, 'read and sum obslogs'):
+            dfs = apexlog.running_sum(iter_obslogs(dir=None, **read_kw), by)
+    else:
+        with apexlog.profile_stage(profile, 'read obslogs'):
+            df = read_obslogs(dir=None, compact=args.compact, **read_kw)
+        with apexlog.profile_stage(profile, 'sum scan duration'):
+            dfs = apexlog.running_sum([df], by)
+
     print(dfs)
+    apexlog.report_profile(profile, args)
     return df, dfs
 
 
@@ -0,0 +1,649 @@
+#!/usr/bin/env python
+# coding: utf-8
+''' apexbench
+Benchmarks of apexlog on synthetic APEX html observing logs.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import with_statement
+import argparse
+import contextlib
+import html
+import io
+import numpy as np
+import os
+import pandas as pd
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+os.environ.setdefault('MPLBACKEND', 'Agg')
+import apexlog
+
+HEADER = ['UTC', 'Scan', 'LST', 'Source', 'Velocity', 'Right Ascension',
+          'Declination', 'Azimuth', 'Elevation', 'CA', 'IE', 'X-Focus',
+          'Y-Focus', 'Z-Focus', 'FocT', 'Scan type', 'Observ. mode',
+          'Observ. geometry', 'Stroke mode', 'Switch mode', 'Offsets',
+          'Reference', 'No. of subscans', 'mm PWV', 'Ambient temperature',
+          'Pressure', 'Humidity', 'Dew point', 'Wind direction',
+          'Wind speed', 'Frontend-Backend', 'Mol. line', 'Command',
+          'Observer ID', 'Operator ID', 'Scan duration', 'Scan status',
+          'Comment']
+
+SOURCES = ['JO201_A', 'JO201_B', 'JO201_C', 'JO204_A', 'JO204_B',
+           'TX-Psc', 'Mars', 'IRC+10216', 'o-Ceti']
+LINES = ['CO_JO201 (221.152)', 'CO_JO204 (220.680)',
+         'CO_JO201_sh (221.430)', 'CO(2-1) (230.538)']
+CATALOG_SOURCES = ['JO201_A', 'JO201_B', 'JO201_C', 'JO204_A', 'JO204_B']
+PARKED_FRACTION = 0.05    # PARK/ZENITH scans
+CLOSED_FRACTION = 0.02    # 'Shutter closed' PWV
+CANCELLED_FRACTION = 0.03    # Scan duration -999
+SCANS = [  # scan type, observing mode, geometry, command
+    ('ONOFF', 'RASTER', 'SINGLE',
+     "on(time=20,drift='NO',feeds=[],offsets=[],offsets_unit='arcsec')"),
+    ('OTF', 'OTF', 'LINE', "otf(xlen=60,ylen=60,time=1.0)"),
+    ('CAL', 'NONE', 'NONE', "calibrate(mode='COLD',time=[10])"),
+    ('POINT', 'OTF', 'CROSS',
+     "point(length=54.0,unit='arcsec',time=20.0,mode='RAS',points=5)"),
+    ('FOCUS-Z', 'NONE', 'NONE',
+     "focus(amplitude=1.0,time=6.0,points=5,axis='Z',mode='sym')"),
+]
+
+
+def write_obslog(filename, start, nscans=50, first_scan=1, seed=0):
+    '''Write a synthetic APEX html obslog
+
+    Parameters
+    ----------
+    filename : string
+        html file to write
+    start : pandas.Timestamp
+        UTC of the first scan
+    nscans : int (optional)
+        Number of scans (table rows)
+    first_scan : int (optional)
+        Scan number of the first scan
+    seed : int (optional)
+        Random seed
+
+    Returns
+    -------
+    filename : string
+        The html file written
+    '''
+
+    rng = np.random.RandomState(seed)
+    duration = rng.randint(5, 300, nscans)
+    utc = start + pd.to_timedelta(np.cumsum(duration + 30) - duration[0] - 30,
+                                  unit='s')
+    lst = (utc + pd.Timedelta(hours=4, minutes=30)).strftime('%H:%M:%S')
+    rows = []
+    for i in range(nscans):
+        scan_type, mode, geometry, command = SCANS[rng.randint(len(SCANS))]
+        source = SOURCES[rng.randint(len(SOURCES))]
+        line = LINES[rng.randint(len(LINES))]
+        pwv = '{:.2f}'.format(rng.gamma(2, 0.6))
+        scan_duration, status, comment = str(duration[i]), 'OK', '-'
+        if rng.rand() < PARKED_FRACTION:
+            source = ['PARK', 'ZENITH'][rng.randint(2)]
+            scan_type, mode, geometry, command = 'GO', 'NONE', 'NONE', 'go()'
+        if rng.rand() < CLOSED_FRACTION:
+            pwv = 'Shutter closed'
+        if rng.rand() < CANCELLED_FRACTION:
+            scan_duration, status = '-999', 'ABORTED'
+            comment = '[Scan canceled by user.]'
+        rows.append([
+            utc[i].strftime('%Y-%m-%dU%H:%M:%S'), str(first_scan + i),
+            lst[i], source,
+            '{:.1f}'.format(rng.uniform(-50, 50)),
+            '00:41:31.0700', '-09:15:23.5000',
+            '{:.1f}'.format(rng.uniform(-180, 180)),
+            '{:.1f}'.format(rng.uniform(20, 88)),
+            '{:.1f}'.format(rng.normal(0, 3)),
+            '{:.1f}'.format(rng.normal(0, 3)),
+            '0.0', '0.2', '{:.3f}'.format(rng.normal(0, 0.1)), 'ON',
+            scan_type, mode, geometry, 'LINEAR', 'WOB 60.0,0.5,POS,86',
+            'EQ[0.0&quot;,0.0&quot;]REL', 'HO[-300.0&quot;,0.0&quot;]REL',
+            str(rng.randint(0, 21)), pwv,
+            '{:.1f}'.format(rng.normal(0, 2)),
+            '{:.1f}'.format(rng.normal(555, 1)),
+            '{:.1f}'.format(rng.uniform(5, 60)),
+            '{:.1f}'.format(rng.normal(-15, 4)),
+            '{:.1f}'.format(rng.uniform(0, 360)),
+            '{:.1f}'.format(rng.gamma(2, 3)),
+            'HET230-XFFTS2 (RefFeed: 1)', line + '; ' + line, command,
+            'PMO', 'FMA', scan_duration, status, comment])
+
+    with open(filename, 'w') as f:
+        f.write('<html>\n<body>\n<table border="1">\n')
+        f.write('<tr>' + ''.join('<th>' + h + '</th>' for h in HEADER) +
+                '</tr>\n')
+        for row in rows:
+            f.write('<tr>' + ''.join('<td>' + v + '</td>' for v in row) +
+                    '</tr>\n')
+        f.write('</table>\n</body>\n</html>\n')
+    return filename
+
+
+def write_obslogs(dir, nlogs, nscans=50, seed=0):
+    '''Write nlogs synthetic obslogs, one per night, to dir'''
+    start = pd.Timestamp('2016-12-01 22:00:00')
+    logs = []
+    for i in range(nlogs):
+        night = start + pd.Timedelta(days=i)
+        filename = os.path.join(dir, night.strftime('%Y-%m-%d') + '.html')
+        logs.append(write_obslog(filename, night, nscans,
+                                 first_scan=1 + i * nscans, seed=seed + i))
+    return logs
+
+
+def write_catalogs(basename):
+    '''Write source (.cat) and line (.lin) catalogs of the science targets
+
+    Parameters
+    ----------
+    basename : string
+        Location/basename of the catalogs
+
+    Returns
+    -------
+    basename : string
+        Location/basename of the catalogs
+    '''
+
+    with open(basename + '.cat', 'w') as f:
+        f.write('! Synthetic apexbench source catalog\n')
+        for source in CATALOG_SOURCES:
+            f.write('{} EQ 2000 00:41:31.07 -09:15:23.50 LSR 0.0\n'.format(
+                source))
+    with open(basename + '.lin', 'w') as f:
+        f.write('! Synthetic apexbench line catalog\n')
+        for line in LINES[:-1]:
+            name, freq = line.split()
+            f.write('{} {}\n'.format(name, freq.strip('()')))
+    return basename
+
+
+def write_obslogs_from_csv(csv, dir):
+    '''Write an apexlog.csv back to html obslogs, one per night
+
+    Parameters
+    ----------
+    csv : string
+        apexlog.csv file written by apexlog.py
+    dir : string
+        Directory for the html obslogs
+
+    Returns
+    -------
+    logs : list
+        The html files written
+    '''
+
+    df = pd.read_csv(csv, index_col=0, dtype=str, keep_default_na=False)
+    names = dict((re.sub('[ -]', '_', re.sub('[().]', '', h)).lower(), h)
+                 for h in HEADER)
+    df = df[[c for c in df.columns if c in names]]
+    utc = pd.to_datetime(df.utc)
+    df['utc'] = utc.dt.strftime('%Y-%m-%dU%H:%M:%S')
+    df['scan_duration'] = (pd.to_timedelta(df.scan_duration) /
+                           pd.Timedelta(seconds=1)).astype(int).astype(str)
+    nights = (utc - pd.Timedelta(hours=12)).dt.strftime('%Y-%m-%d')
+    logs = []
+    for night, rows in df.groupby(nights.values):
+        filename = os.path.join(dir, night + '.html')
+        with open(filename, 'w') as f:
+            f.write('<html>\n<body>\n<table border="1">\n')
+            f.write('<tr>' + ''.join('<th>' + names[c] + '</th>'
+                                     for c in rows.columns) + '</tr>\n')
+            for row in rows.itertuples(index=False):
+                f.write('<tr>' + ''.join('<td>' + html.escape(v) + '</td>'
+                                         for v in row) + '</tr>\n')
+            f.write('</table>\n</body>\n</html>\n')
+        logs.append(filename)
+    return logs
+
+
+@contextlib.contextmanager
+def quiet():
+    '''Silence the 'Reading obslog' chatter'''
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+
+def timed(func, *args, **kwargs):
+    '''Wall time [s] of func(*args, **kwargs), quietly'''
+    with quiet():
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        return time.perf_counter() - t0
+
+
+def measure(func, *args, **kwargs):
+    '''Wall time [s] and peak traced memory [MB] of func(*args, **kwargs)
+
+    func is run twice, once timed and once under tracemalloc, so the
+    tracing overhead does not affect the timing.
+
+    Returns
+    -------
+    result
+        Return value of the timed run
+    wall : float
+        Wall time [s]
+    peak : float
+        Peak memory allocated during the run [MB]
+    '''
+
+    with quiet():
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        wall = time.perf_counter() - t0
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, wall, peak / 2**20
+
+
+def concat_loop(frames):
+    '''Grow a DataFrame with pd.concat in a loop (the old read_obslogs)'''
+    df = frames[0]
+    for frame in frames[1:]:
+        df = pd.concat([df, frame], axis=0)
+    return df
+
+
+def bench_concat(sizes=(10, 100, 1000), nscans=20):
+    '''Benchmark read_obslogs ingest time against number of obslogs
+
+    For each number of logs, times the concatenation of pre-parsed frames
+    in a loop (quadratic) and collected (linear), and a full read_obslogs
+    with a warm parse cache.
+    '''
+
+    print('{:>6} {:>12} {:>12} {:>14} {:>10}'.format(
+        'logs', 'loop [s]', 'collect [s]', 'read_obslogs', 'ms/log'))
+    for nlogs in sizes:
+        tmp = tempfile.mkdtemp(prefix='apexbench')
+        cache_dir = apexlog.CACHE_DIR
+        try:
+            apexlog.CACHE_DIR = os.path.join(tmp, 'cache', '')
+            obslogs = os.path.join(tmp, 'obslogs', '')
+            os.makedirs(obslogs)
+            logs = write_obslogs(obslogs, nlogs, nscans)
+            with quiet():
+                frames = [apexlog.read_cached_log(log) for log in logs]
+            t_loop = timed(concat_loop, frames)
+            t_collect = timed(pd.concat, frames, axis=0)
+            t_read = timed(apexlog.read_obslogs, obslogs)
+        finally:
+            apexlog.CACHE_DIR = cache_dir
+            shutil.rmtree(tmp)
+        print('{:6d} {:12.3f} {:12.3f} {:14.3f} {:10.2f}'.format(
+            nlogs, t_loop, t_collect, t_read, 1e3 * t_read / nlogs))
+
+
+def bench_parser(csv='apexlog.csv', repeat=5):
+    '''Benchmark the fast obslog table parser against pandas.read_html
+
+    Times read_obslog_table with both parsers on the obslogs behind
+    apexlog.csv (written back to html), and checks the tables agree (to
+    float precision, read_html rounds some floats by an ulp).
+    '''
+
+    tmp = tempfile.mkdtemp(prefix='apexbench')
+    try:
+        logs = write_obslogs_from_csv(csv, tmp)
+        times = {}
+        for parser in ['pandas', 'fast']:
+            times[parser] = min(
+                timed(lambda: [apexlog.read_obslog_table(log, parser)
+                               for log in logs])
+                for i in range(repeat))
+        same = True
+        for log in logs:
+            try:
+                pd.testing.assert_frame_equal(
+                    apexlog.read_obslog_table(log, 'fast'),
+                    apexlog.read_obslog_table(log, 'pandas'))
+            except AssertionError:
+                same = False
+    finally:
+        shutil.rmtree(tmp)
+    print('{} obslogs from {}, best of {}:'.format(len(logs), csv, repeat))
+    for parser in ['pandas', 'fast']:
+        print('{:>8} {:8.3f} s'.format(parser, times[parser]))
+    print('Speed-up: {:.1f}x, equal tables: {}'.format(
+        times['pandas'] / times['fast'], same))
+
+
+def bench_lines(csv='apexlog.csv', sizes=(1000, 100000), repeat=5):
+    '''Benchmark split_mol_line against the per-row apply it replaced
+
+    Times deriving the line names from the 'Mol. line' entries of
+    apexlog.csv, repeated to each number of rows, and checks both agree.
+    '''
+
+    mol_line = pd.read_csv(csv).mol_line
+    print('{:>8} {:>12} {:>12} {:>10} {:>7}'.format(
+        'rows', 'apply [s]', 'split [s]', 'speed-up', 'equal'))
+    for nrows in sizes:
+        entries = mol_line.take(np.arange(nrows) % len(mol_line))
+        entries.index = np.arange(nrows)
+        t_apply = min(timed(entries.apply, lambda entry: entry.split()[0])
+                      for i in range(repeat))
+        t_split = min(timed(apexlog.split_mol_line, entries)
+                      for i in range(repeat))
+        same = (entries.apply(lambda entry: entry.split()[0]).values ==
+                apexlog.split_mol_line(entries).line.values).all()
+        print('{:8d} {:12.4f} {:12.4f} {:9.1f}x {:>7}'.format(
+            nrows, t_apply, t_split, t_apply / t_split, str(same)))
+
+
+def bench_utc(csv='apexlog.csv', sizes=(1000, 300000), repeat=5):
+    '''Benchmark parse_utc/parse_lst against the generic pandas parsers
+
+    Times converting the UTC and LST strings of apexlog.csv, repeated to
+    each number of rows, and checks both agree.
+    '''
+
+    df = pd.read_csv(csv, usecols=['utc', 'lst'])
+    utc = pd.to_datetime(df.utc).dt.strftime(apexlog.UTC_FORMAT)
+    print('{:>8} {:>6} {:>12} {:>12} {:>10} {:>7}'.format(
+        'rows', 'column', 'pandas [s]', 'fixed [s]', 'speed-up', 'equal'))
+    for nrows in sizes:
+        take = np.arange(nrows) % len(df)
+        for name, values, generic, fixed in [
+                ('UTC', utc, lambda values: pd.to_datetime(
+                    values, format=apexlog.UTC_FORMAT), apexlog.parse_utc),
+                ('LST', df.lst, lambda values: pd.to_timedelta(
+                    values).dt.total_seconds(), apexlog.parse_lst)]:
+            values = values.take(take)
+            values.index = np.arange(nrows)
+            t_generic = min(timed(generic, values) for i in range(repeat))
+            t_fixed = min(timed(fixed, values) for i in range(repeat))
+            same = generic(values).equals(fixed(values))
+            print('{:8d} {:>6} {:12.4f} {:12.4f} {:9.1f}x {:>7}'.format(
+                nrows, name, t_generic, t_fixed, t_generic / t_fixed,
+                str(same)))
+
+
+def bench_match(sizes=(10000, 300000), nlines=3000, repeat=5):
+    '''Benchmark match_lines of scans to a large line catalogue
+
+    Random catalogue frequencies over the APEX bands, and scans at
+    catalogue frequencies with 0.5 MHz scatter, matched within 1 MHz.
+    '''
+
+    rng = np.random.RandomState(0)
+    freqs = rng.uniform(150, 950, nlines).round(3)
+    sci_lines = dict(('L{}'.format(i), freq) for i, freq in enumerate(freqs))
+    print('{} catalogue lines, best of {}:'.format(nlines, repeat))
+    print('{:>8} {:>12} {:>10}'.format('scans', 'match [s]', 'matched'))
+    for nscans in sizes:
+        freq_ghz = (rng.choice(freqs, nscans) +
+                    rng.normal(0, 0.0005, nscans)).round(4)
+        t_match = min(timed(apexlog.match_lines, freq_ghz, sci_lines)
+                      for i in range(repeat))
+        matched = pd.notna(apexlog.match_lines(freq_ghz, sci_lines)).mean()
+        print('{:8d} {:12.4f} {:9.0%}'.format(nscans, t_match, matched))
+
+
+def bench_ecdf(sizes=(10000, 300000), repeat=3):
+    '''Benchmark rendering the cumulative PWV panel
+
+    Times drawing random PWV (2 decimals, one 20 mm outlier) as the
+    0.01 mm cumulative histogram plot_apexlog used before, and as the
+    step line of plot_pwv_ecdf, each rendered to png.
+    '''
+
+    plt = apexlog.pyplot()
+
+    def hist(ax, pwv):
+        valid = pwv[~np.isnan(pwv)]
+        ax.hist(valid, bins=np.arange(0, valid.max(), 0.01), cumulative=True,
+                density=True, orientation='horizontal')
+
+    def render(plot, pwv):
+        fig, ax = plt.subplots(figsize=(3.2, 2.4))
+        plot(ax, pwv)
+        fig.savefig(io.BytesIO(), format='png', dpi=120)
+        plt.close(fig)
+
+    rng = np.random.RandomState(0)
+    print('Best of {}:'.format(repeat))
+    print('{:>8} {:>12} {:>12} {:>10}'.format(
+        'scans', 'hist [s]', 'ecdf [s]', 'speed-up'))
+    for nscans in sizes:
+        pwv = rng.lognormal(0, 0.6, nscans).round(2)
+        pwv[0] = 20.
+        t_hist = min(timed(render, hist, pwv) for i in range(repeat))
+        t_ecdf = min(timed(render, apexlog.plot_pwv_ecdf, pwv)
+                     for i in range(repeat))
+        print('{:8d} {:12.4f} {:12.4f} {:9.1f}x'.format(
+            nscans, t_hist, t_ecdf, t_hist / t_ecdf))
+
+
+def bench_pwv(sizes=(10000, 300000), repeat=3):
+    '''Benchmark rendering the PWV time series panel
+
+    Times drawing random PWV of scans over 5 years with every scan as a
+    marker, and decimated with decimate_pwv, each rendered to png.
+    '''
+
+    plt = apexlog.pyplot()
+
+    def render(utc, pwv, decimate):
+        fig, ax = plt.subplots(figsize=(9.6, 2.4))
+        if decimate:
+            index = apexlog.decimate_pwv(utc, pwv, ax.bbox.width,
+                                         ax.bbox.height)
+            utc, pwv = utc[index], pwv[index]
+        ax.plot(utc, pwv, 'o', mfc='none', mew=1, rasterized=True)
+        fig.savefig(io.BytesIO(), format='png', dpi=120)
+        plt.close(fig)
+        return len(pwv)
+
+    rng = np.random.RandomState(0)
+    print('Best of {}:'.format(repeat))
+    print('{:>8} {:>12} {:>13} {:>10} {:>8}'.format(
+        'scans', 'all [s]', 'decimated [s]', 'speed-up', 'markers'))
+    for nscans in sizes:
+        utc = np.sort(np.datetime64('2015-01-01T00:00:00') +
+                      rng.randint(0, 5 * 365 * 86400, nscans).astype('m8[s]'))
+        pwv = rng.lognormal(0, 0.6, nscans).round(2)
+        t_all = min(timed(render, utc, pwv, False) for i in range(repeat))
+        t_decimated = min(timed(render, utc, pwv, True)
+                          for i in range(repeat))
+        print('{:8d} {:12.4f} {:13.4f} {:9.1f}x {:8d}'.format(
+            nscans, t_all, t_decimated, t_all / t_decimated,
+            render(utc, pwv, True)))
+
+
+def bench_incremental(nscans=400, steps=4):
+    '''Benchmark and check ObslogSummary updates of a growing obslog
+
+    An obslog is read (and cached) with its first scans, as by an earlier
+    sumlogs.py run, then grows by nscans / steps scans at a time. Each
+    ObslogSummary.update, starting from the cache, is timed and checked
+    against the summary of a full parse of the obslog.
+    '''
+
+    kwargs = dict(exclude=['PARK', 'ZENITH'], drop_closed=True)
+    tmp = tempfile.mkdtemp(prefix='apexbench')
+    cache_dir = apexlog.CACHE_DIR
+    try:
+        apexlog.CACHE_DIR = os.path.join(tmp, 'cache', '')
+        full = write_obslog(os.path.join(tmp, 'full.html'),
+                            pd.Timestamp('2016-12-01 22:00:00'), nscans)
+        with open(full, 'rb') as f:
+            data = f.read()
+        ends = [match.end() for match in apexlog.ROW_END_RE.finditer(data)]
+        obslogs = os.path.join(tmp, 'obslogs', '')
+        os.makedirs(obslogs)
+        log = os.path.join(obslogs, '2016-12-01.html')
+
+        def grow(step):
+            '''Write the obslog with the scans up to step'''
+            with open(log, 'wb') as f:
+                f.write(data[:ends[step * nscans // steps]] +
+                        b'\n</table>\n</body>\n</html>\n')
+            os.utime(log, (step, step))
+
+        grow(1)
+        with quiet():
+            apexlog.read_obslogs(obslogs, **kwargs)
+        summary = apexlog.ObslogSummary(obslogs, **kwargs)
+        print('{:>6} {:>12} {:>7}'.format('scans', 'update [s]', 'equal'))
+        for step in range(2, steps + 1):
+            grow(step)
+            t_update = timed(summary.update)
+            with quiet():
+                df = apexlog.read_obslogs(obslogs, cache=False, **kwargs)
+            same = summary.total().equals(
+                apexlog.running_sum([df], summary.by))
+            print('{:6d} {:12.4f} {:>7}'.format(step * nscans // steps,
+                                                t_update, str(same)))
+    finally:
+        apexlog.CACHE_DIR = cache_dir
+        shutil.rmtree(tmp)
+
+
+def bench_stages(nlogs=30, nscans=200):
+    '''Benchmark time and peak memory of each apexlog stage
+
+    Stages: read_one_log, read_obslogs without and with a warm parse
+    cache, summarise_sciobs, and plot_apexlog including saving the png.
+    '''
+
+    import matplotlib.pyplot as plt
+
+    def plot(df, dfs):
+        fig = apexlog.plot_apexlog(df, dfs, 'BENCH')
+        fig.savefig(os.path.join(tmp, 'apexlog.png'), bbox_inches='tight',
+                    dpi=120)
+        plt.close(fig)
+
+    tmp = tempfile.mkdtemp(prefix='apexbench')
+    cache_dir = apexlog.CACHE_DIR
+    try:
+        apexlog.CACHE_DIR = os.path.join(tmp, 'cache', '')
+        obslogs = os.path.join(tmp, 'obslogs', '')
+        os.makedirs(obslogs)
+        logs = write_obslogs(obslogs, nlogs, nscans)
+        catalogs = write_catalogs(os.path.join(tmp, 'bench'))
+        with quiet():
+            sci_sources = apexlog.read_sourcecat(catalogs)
+            sci_lines = apexlog.read_linecat(catalogs)
+            apexlog.read_obslogs(obslogs)
+
+        results = []
+        result, wall, peak = measure(apexlog.read_one_log, logs[0])
+        results.append(('read_one_log', wall, peak))
+        df, wall, peak = measure(apexlog.read_obslogs, obslogs, cache=False)
+        results.append(('read_obslogs', wall, peak))
+        result, wall, peak = measure(apexlog.read_obslogs, obslogs)
+        results.append(('read_obslogs (cache)', wall, peak))
+        dfs, wall, peak = measure(apexlog.summarise_sciobs, sci_sources,
+                                  sci_lines, df)
+        results.append(('summarise_sciobs', wall, peak))
+        result, wall, peak = measure(plot, df, dfs)
+        results.append(('plot_apexlog', wall, peak))
+    finally:
+        apexlog.CACHE_DIR = cache_dir
+        shutil.rmtree(tmp)
+
+    print('{} obslogs x {} scans:'.format(nlogs, nscans))
+    print('{:<22} {:>10} {:>10}'.format('stage', 'wall [s]', 'peak [MB]'))
+    for stage, wall, peak in results:
+        print('{:<22} {:10.3f} {:10.1f}'.format(stage, wall, peak))
+
+
+def bench_startup(repeat=5):
+    '''Benchmark apexlog import time, with and without matplotlib
+
+    apexlog imports matplotlib only when plotting; importing it up front
+    as well shows the start-up cost saved by a summary only run.
+    '''
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    statements = [
+        ('python', 'pass'),
+        ('import apexlog', 'import apexlog'),
+        ('import apexlog + matplotlib',
+         'import apexlog, matplotlib.pyplot, matplotlib.gridspec'),
+    ]
+    print('Start-up time, best of {}:'.format(repeat))
+    for name, statement in statements:
+        times = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', statement], cwd=here)
+            times.append(time.perf_counter() - t0)
+        print('{:<30} {:8.3f} s'.format(name, min(times)))
+
+
+def parse_inputs():
+    '''Parse benchmark name and options'''
+    parser = argparse.ArgumentParser(
+        description='Benchmarks apexlog on synthetic APEX obslogs')
+    parser.add_argument('benchmark',
+                        choices=['stages', 'concat', 'parser', 'lines',
+                                 'utc', 'match', 'ecdf', 'pwv',
+                                 'incremental', 'startup', 'generate'],
+                        help='Benchmark to run, or generate obslogs')
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        help='Numbers of obslogs')
+    parser.add_argument('-s', '--scans', type=int,
+                        help='Scans per obslog')
+    parser.add_argument('-o', '--obslogs', type=str, default='obslogs/',
+                        help='Directory for generated obslogs/catalogs')
+    parser.add_argument('--csv', type=str, default='apexlog.csv',
+                        help='apexlog.csv to rebuild obslogs from')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_inputs()
+    if args.benchmark == 'stages':
+        bench_stages((args.sizes or [30])[0], args.scans or 200)
+    elif args.benchmark == 'concat':
+        bench_concat(args.sizes or [10, 100, 1000], args.scans or 20)
+    elif args.benchmark == 'parser':
+        bench_parser(args.csv)
+    elif args.benchmark == 'lines':
+        bench_lines(args.csv, args.sizes or [1000, 100000])
+    elif args.benchmark == 'utc':
+        bench_utc(args.csv, args.sizes or [1000, 300000])
+    elif args.benchmark == 'match':
+        bench_match(args.sizes or [10000, 300000])
+    elif args.benchmark == 'ecdf':
+        bench_ecdf(args.sizes or [10000, 300000])
+    elif args.benchmark == 'pwv':
+        bench_pwv(args.sizes or [10000, 300000])
+    elif args.benchmark == 'incremental':
+        bench_incremental(args.scans or 400)
+    elif args.benchmark == 'startup':
+        bench_startup()
+    elif args.benchmark == 'generate':
+        if not os.path.isdir(args.obslogs):
+            os.makedirs(args.obslogs)
+        logs = write_obslogs(args.obslogs, (args.sizes or [30])[0],
+                             args.scans or 200)
+        write_catalogs(os.path.join(args.obslogs, 'bench'))
+        print('Wrote {} obslogs and bench.cat/lin to {}'.format(
+            len(logs), args.obslogs))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,15 +9,60 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import with_statement
 import argparse
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
 import numpy as np
+import os
 import pandas as pd
+import pickle
 import re
+import time
+import tracemalloc
+from functools import partial
+from html import unescape
 from os.path import expanduser
 from getpass import getuser
 from glob import glob
 
+CACHE_DIR = expanduser('~/.cache/apexlog/')
+CACHE_VERSION = 4
+STORE = 'apexlog.parquet'
+STORE_VERSION = 3
+MANIFEST = os.path.join(CACHE_DIR, 'manifest.json')
+MANIFEST_VERSION = 1
+RENDER_CACHE = os.path.join(CACHE_DIR, 'render.json')
+RENDER_VERSION = 1
+UTC_FORMAT = '%Y-%m-%dU%H:%M:%S'
+EXCLUDED_SOURCES = ['PARK', 'ZENITH']
+TABLE_RE = re.compile(r'<table\b[^>]*>(.*?)</table\s*>', re.S | re.I)
+TABLE_START_RE = re.compile(r'<table\b', re.I)
+SPAN_RE = re.compile(r'<t[dh]\b[^>]*\b(?:col|row)span\b', re.I)
+TABLE_END_RE = re.compile(br'</table', re.I)
+ROW_END_RE = re.compile(br'</tr\s*>', re.I)
+ROW_RE = re.compile(r'<tr\b[^>]*>', re.I)
+CELL_RE = re.compile(r'<(t[dh])\b[^>]*>(.*?)</\1\s*>', re.S | re.I)
+CELL_START_RE = re.compile(r'<t[dh]\b', re.I)
+TAG_RE = re.compile(r'<[^>]*>')
+MOL_LINE_RE = re.compile(r'\s*(\S+)(?:\s*\(([^)]*)\))?'
+                         r'(?:\s*;\s*(\S+)(?:\s*\(([^)]*)\))?)?')
+LINE_COLUMNS = ['line', 'freq_ghz', 'line2', 'freq2_ghz']
+CATEGORY_COLUMNS = ['source', 'line', 'line2', 'mol_line', 'scan_type',
+                    'scan_status', 'frontend_backend', 'observ_mode',
+                    'observ_geometry', 'stroke_mode', 'switch_mode', 'foct',
+                    'offsets', 'reference', 'observer_id', 'operator_id']
+FLOAT32_COLUMNS = ['velocity', 'azimuth', 'elevation', 'ca', 'ie', 'x_focus',
+                   'y_focus', 'z_focus', 'mm_pwv', 'ambient_temperature',
+                   'pressure', 'humidity', 'dew_point', 'wind_direction',
+                   'wind_speed']
+REQUIRED_COLUMNS = ['utc', 'source', 'mol_line', 'scan_duration', 'mm_pwv']
+REPORT_COLUMNS = ['utc', 'source', 'mol_line', 'scan_type', 'scan_status',
+                  'scan_duration', 'mm_pwv']
+NA_VALUES = frozenset(['', 'NaN', 'nan', 'NA', 'N/A', 'n/a', 'NULL', 'null',
+                       'None', '#N/A', '<NA>'])
+
 
 def read_sourcecat(cat=None):
     '''Parse APEX source catalogue (.cat)
@@ -79,13 +124,375 @@ def read_linecat(cat=None):
     return sci_lines
 
 
-def read_one_log(filename):
-    '''Read a html obslog to pandas DataFrame
+def _cell_text(text):
+    '''Plain text of a table cell: tags removed, entities decoded'''
+    if '<' in text:
+        text = TAG_RE.sub('', text)
+    if '&' in text:
+        text = unescape(text)
+    return ' '.join(text.split())
+
+
+def _decode(data):
+    '''Decode html bytes, utf-8 or latin-1'''
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def obslog_where(exclude=None, drop_closed=False, sources=None):
+    '''Row predicates of read_one_log options, for parse_obslog_table
+
+    Parameters
+    ----------
+    exclude : list (optional)
+        Sources to drop, defaults to EXCLUDED_SOURCES (PARK/ZENITH)
+    drop_closed : bool (optional)
+        Drop scans with 'Shutter closed' PWV
+    sources : list (optional)
+        Only keep scans of these sources
+
+    Returns
+    -------
+    where : dict
+        Functions of the cell text by column name, True for rows to keep
+    '''
+
+    if exclude is None:
+        exclude = EXCLUDED_SOURCES
+    exclude = frozenset(exclude)
+    if sources is None:
+        where = {'Source': lambda cell: cell not in exclude}
+    else:
+        sources = frozenset(sources) - exclude
+        where = {'Source': sources.__contains__}
+    if drop_closed:
+        where['mm PWV'] = lambda cell: cell != 'Shutter closed'
+    return where
+
+
+def parse_obslog_rows(text, where=None, columns=None, width=None):
+    '''Parse the <tr> rows of (a part of) an obslog table to lists of cells
+
+    where maps column positions to functions of the cell text. Rows for
+    which one returns False are None, without parsing their other cells.
+    Only the cells at the positions in columns are parsed, if given. Raises
+    ValueError for a row of other than width cells, if given, and for a
+    row with content but no closed cells (e.g. <td> without </td>).
+    '''
+    rows = []
+    for row in ROW_RE.split(text)[1:]:
+        cells = CELL_RE.findall(row)
+        if not cells:
+            if CELL_START_RE.search(row) or TAG_RE.sub('', row).strip():
+                raise ValueError('Unclosed cells in obslog table')
+            continue
+        if width is not None and len(cells) != width:
+            raise ValueError('Irregular obslog table')
+        if where and not all(col < len(cells) and keep(_cell_text(
+                cells[col][1])) for col, keep in where.items()):
+            rows.append(None)
+        elif columns is None:
+            rows.append([_cell_text(cell) for tag, cell in cells])
+        else:
+            rows.append([_cell_text(cells[col][1]) for col in columns])
+    return rows
+
+
+def _column_name(name):
+    '''obslog column name as used by apexlog, e.g. 'Mol. line' to mol_line'''
+    return re.sub('[ -]', '_', re.sub('[().]', '', name)).lower()
+
+
+def _select_columns(header, columns):
+    '''Positions of the header names (or their _column_name) in columns'''
+    return [i for i, name in enumerate(header)
+            if name in columns or _column_name(name) in columns]
+
+
+def _read_header(data):
+    '''Cells of the first row of html obslog bytes, None if none'''
+    match = ROW_END_RE.search(data)
+    rows = [] if match is None else parse_obslog_rows(
+        _decode(data[:match.end()]))
+    return rows[0] if rows else None
+
+
+def parse_obslog_table(text, where=None, columns=None):
+    '''Parse the first table of an APEX html obslog to rows of cells
+
+    A regular expression scan over <tr>/<td> tags, without building a
+    document tree. Raises ValueError for tables it does not handle
+    (missing table, nested tables, row/colspan, ragged rows).
+
+    Parameters
+    ----------
+    text : string
+        obslog html
+    where : dict (optional)
+        Functions of the cell text by column name, rows for which one
+        returns False are skipped (None), see obslog_where
+    columns : collection (optional)
+        Only parse the cells of these columns, by header or apexlog name
+        (e.g. 'Mol. line' or 'mol_line')
+
+    Returns
+    -------
+    header : list
+        Cells of the first row (of the selected columns)
+    rows : list
+        Lists of cells of the following rows, None for skipped rows
+    '''
+
+    match = TABLE_RE.search(text)
+    if match is None:
+        raise ValueError('No table in obslog')
+    table = match.group(1)
+    if TABLE_START_RE.search(table) or SPAN_RE.search(table):
+        raise ValueError('Nested table or spanning cell in obslog')
+    first = ROW_RE.search(table)
+    second = None if first is None else ROW_RE.search(table, first.end())
+    end = len(table) if second is None else second.start()
+    header = parse_obslog_rows(table[:end])
+    if len(header) != 1:
+        raise ValueError('Empty obslog table')
+    header = header[0]
+    if len(set(header)) != len(header):
+        raise ValueError('Irregular obslog table')
+    if where:
+        where = dict((header.index(name), keep)
+                     for name, keep in where.items() if name in header)
+    if columns is not None:
+        columns = _select_columns(header, columns)
+    rows = parse_obslog_rows(table[end:], where, columns, len(header))
+    if columns is not None:
+        header = [header[col] for col in columns]
+    return header, rows
+
+
+def _column(values, kind=None):
+    '''Convert a list of cell strings to a numeric or string column
+
+    The column type is inferred like pandas.read_html, unless kind forces
+    it: 'i' (int64), 'f' (float64) or 'O' (strings). Raises ValueError if
+    the values do not fit the forced type.
+    '''
+    na = [v in NA_VALUES for v in values]
+    if any(na):
+        if kind == 'i':
+            raise ValueError('Missing value in integer column')
+        values = [np.nan if isna else v for v, isna in zip(values, na)]
+    elif kind in (None, 'i'):
+        try:
+            return np.array(values, dtype=np.int64)
+        except (OverflowError, ValueError):
+            if kind == 'i':
+                raise ValueError('Non-integer value in integer column')
+    if kind in (None, 'f'):
+        try:
+            return np.array(values, dtype=np.float64)
+        except ValueError:
+            if kind == 'f':
+                raise
+    return values
+
+
+def obslog_frame(header, rows, kinds=None):
+    '''DataFrame of parsed obslog table rows
+
+    Parameters
+    ----------
+    header : list
+        Column names
+    rows : list
+        Lists of cells (None for skipped rows), see parse_obslog_table
+    kinds : list (optional)
+        Forced column types, see _column
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog table, indexed by row number
+    '''
+
+    index = [i for i, row in enumerate(rows) if row is not None]
+    if len(index) < len(rows):
+        rows = [rows[i] for i in index]
+    columns = zip(*rows) if rows else [[]] * len(header)
+    if kinds is None:
+        kinds = [None] * len(header)
+    return pd.DataFrame(dict((name, _column(values, kind))
+                             for name, values, kind in zip(header, columns,
+                                                           kinds)),
+                        index=index, columns=header)
+
+
+def read_obslog_table(filename, parser='fast', data=None, where=None,
+                      columns=None):
+    '''Read the table of a html obslog to pandas DataFrame
 
     Parameters
     ----------
     filename : string
         obslog html file
+    parser : string (optional)
+        'fast' for parse_obslog_table, falling back to pandas.read_html for
+        tables it cannot handle, or 'pandas' for pandas.read_html
+    data : bytes (optional)
+        Content of filename, if already read
+    where : dict (optional)
+        Row predicates applied while parsing (fast parser only), see
+        obslog_where
+    columns : collection (optional)
+        Only read these columns, see parse_obslog_table
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog table with the header row as column names
+    '''
+
+    if data is None:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    if parser == 'fast':
+        try:
+            header, rows = parse_obslog_table(_decode(data), where, columns)
+        except ValueError:
+            pass
+        else:
+            return obslog_frame(header, rows)
+    df = pd.read_html(io.BytesIO(data), header=0)[0]
+    if columns is not None:
+        df = df.iloc[:, _select_columns(list(df.columns), columns)]
+    return df
+
+
+def _fixed_digits(values, pattern):
+    '''Digits of fixed-width strings, None if any string does not match
+
+    Parameters
+    ----------
+    values : array_like
+        Strings of the same width as pattern
+    pattern : string
+        '0' for a digit, any other character must match literally,
+        e.g. '0000-00-00U00:00:00'
+
+    Returns
+    -------
+    digits : numpy.ndarray or None
+        int64 array of shape (len(values), number of digits)
+    '''
+
+    width = len(pattern)
+    try:
+        # one more byte, so longer strings leave a non-NUL last byte
+        data = np.asarray(values, dtype='S{}'.format(width + 1))
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return None
+    data = data.view(np.uint8).reshape(len(data), width + 1)
+    code = np.frombuffer(pattern.encode('ascii') + b'\0', dtype=np.uint8)
+    digit = code == ord('0')
+    if not (data[:, ~digit] == code[~digit]).all():
+        return None
+    digits = data[:, digit].astype(np.int64) - ord('0')
+    if not ((digits >= 0) & (digits <= 9)).all():
+        return None
+    return digits
+
+
+def _number(digits, start, stop):
+    '''Integers of the digit columns start:stop, see _fixed_digits'''
+    number = np.zeros(len(digits), dtype=np.int64)
+    for i in range(start, stop):
+        number = number * 10 + digits[:, i]
+    return number
+
+
+def parse_utc(values):
+    '''Convert obslog UTC strings ('YYYY-MM-DDUHH:MM:SS') to datetime64
+
+    The fixed-width fields are sliced into integer arrays and combined to
+    datetime64 directly, falling back to pandas.to_datetime with
+    UTC_FORMAT if any string is malformed or not a valid date/time.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        UTC strings
+
+    Returns
+    -------
+    utc : pandas.Series
+        UTC as datetime64, as pandas.to_datetime(values, format=UTC_FORMAT)
+    '''
+
+    digits = _fixed_digits(values, '0000-00-00U00:00:00')
+    if digits is not None and len(digits):
+        year, month, day = (_number(digits, 0, 4), _number(digits, 4, 6),
+                            _number(digits, 6, 8))
+        hour, minute, second = (_number(digits, 8, 10),
+                                _number(digits, 10, 12),
+                                _number(digits, 12, 14))
+        valid = ((month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) &
+                 (minute < 60) & (second < 60)).all()
+        if valid:
+            start = ((year - 1970) * 12 + month - 1).astype('M8[M]')
+            date = start.astype('M8[D]') + (day - 1)
+            valid = (date.astype('M8[M]') == start).all()
+        if valid:
+            utc = date.astype('M8[s]') + (hour * 3600 + minute * 60 + second)
+            # the datetime64 unit pandas.to_datetime gives for this version
+            dtype = pd.to_datetime(values.iloc[:1], format=UTC_FORMAT).dtype
+            return pd.Series(utc, index=values.index,
+                             name=values.name).astype(dtype)
+    return pd.to_datetime(values, format=UTC_FORMAT)
+
+
+def parse_lst(values):
+    '''Convert obslog LST strings ('HH:MM:SS') to seconds of day
+
+    As parse_utc, with a fallback to pandas.to_timedelta; malformed values
+    are NaN.
+
+    Parameters
+    ----------
+    values : pandas.Series
+        LST strings
+
+    Returns
+    -------
+    lst : pandas.Series
+        LST [s] as float
+    '''
+
+    digits = _fixed_digits(values, '00:00:00')
+    if digits is not None:
+        hour, minute, second = (_number(digits, 0, 2), _number(digits, 2, 4),
+                                _number(digits, 4, 6))
+        if ((hour < 24) & (minute < 60) & (second < 60)).all():
+            seconds = hour * 3600 + minute * 60 + second
+            return pd.Series(seconds.astype(float), index=values.index,
+                             name=values.name)
+    lst = pd.to_timedelta(values.astype(str), errors='coerce')
+    return lst.dt.total_seconds()
+
+
+def clean_obslog(df, exclude=None, drop_closed=False, sources=None):
+    '''Drop non-science sources and convert obslog table columns, in place
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        obslog table, see read_obslog_table
+    exclude : list (optional)
+        Sources to drop, defaults to EXCLUDED_SOURCES (PARK/ZENITH)
+    drop_closed : bool (optional)
+        Drop scans with 'Shutter closed' PWV, otherwise PWV is set to NaN
+    sources : list (optional)
+        Only keep scans of these sources
 
     Returns
     -------
@@ -93,30 +500,224 @@ def read_one_log(filename):
         The obslog data
     '''
 
-    print('Reading obslog:', filename)
-    df = pd.read_html(filename, header=0)[0]
-    df['UTC'] = pd.to_datetime(df.UTC, format='%Y-%m-%dU%H:%M:%S')
+    if exclude is None:
+        exclude = EXCLUDED_SOURCES
+    df.drop(df[df.Source.isin(exclude)].index, inplace=True)
+    if sources is not None:
+        df.drop(df[~df.Source.isin(sources)].index, inplace=True)
+    if drop_closed:
+        df.drop(df[df['mm PWV'].astype(str) == 'Shutter closed'].index,
+                inplace=True)
+    df['UTC'] = parse_utc(df.UTC)
+    if 'LST' in df.columns:
+        df['LST seconds'] = parse_lst(df.LST)
     cancelled = df[df['Scan duration'] == -999]
     df.loc[cancelled.index, 'Scan duration'] = 0
     df['Scan duration'] = pd.to_timedelta(df['Scan duration'], unit='s')
-    df.drop(df[(df.Source == 'PARK') | (df.Source == 'ZENITH')].index,
-            inplace=True)
-    df['mm PWV'] = df[['mm PWV']].apply(pd.to_numeric)
+    df['mm PWV'] = pd.to_numeric(df['mm PWV'], errors='coerce')
     return df
 
 
-def get_line_name(string):
-    '''Get first white spaced delimited part of string'''
-    return string.split()[0]
+def read_one_log(filename, exclude=None, drop_closed=False,
+                 parser='fast', data=None, sources=None, columns=None):
+    '''Read a html obslog to pandas DataFrame
 
+    Rows of excluded (or not selected) sources and closed shutter scans
+    are skipped by the fast parser, before any column conversion, as are
+    the cells of columns not asked for.
 
-def read_obslogs(dir=None):
-    '''Read APEX html obslogs
+    Parameters
+    ----------
+    filename : string
+        obslog html file
+    exclude : list (optional)
+        Sources to drop, defaults to EXCLUDED_SOURCES (PARK/ZENITH)
+    drop_closed : bool (optional)
+        Drop scans with 'Shutter closed' PWV, otherwise PWV is set to NaN
+    parser : string (optional)
+        Table parser, 'fast' or 'pandas', see read_obslog_table
+    data : bytes (optional)
+        Content of filename, if already read
+    sources : list (optional)
+        Only keep scans of these sources
+    columns : list (optional)
+        Only read these columns (by apexlog name, e.g. mol_line) and
+        REQUIRED_COLUMNS, defaults to all
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog data
+    '''
+
+    print('Reading obslog:', filename)
+    df = read_obslog_table(filename, parser, data,
+                           obslog_where(exclude, drop_closed, sources),
+                           _read_columns(columns))
+    return clean_obslog(df, exclude, drop_closed, sources)
+
+
+def _read_columns(columns):
+    '''Columns to read for the read_one_log columns option, None for all'''
+    if columns is None:
+        return None
+    return set(columns) | set(REQUIRED_COLUMNS)
+
+
+def _rows_end(data):
+    '''Byte offset after the last </tr> of the first table, -1 if none'''
+    match = TABLE_END_RE.search(data)
+    end = len(data) if match is None else match.start()
+    last = max(data.rfind(b'</tr>', 0, end), data.rfind(b'</TR>', 0, end))
+    return -1 if last < 0 else last + len(b'</tr>')
+
+
+def _read_tail(filename, data, entry, exclude=None, drop_closed=False,
+               parser='fast', sources=None, columns=None):
+    '''Parse the rows appended to an obslog since entry, None if unable'''
+    if parser != 'fast' or entry.get('offset', -1) < 0:
+        return None
+    offset = entry['offset']
+    if (len(data) <= offset or hashlib.sha1(data[:offset]).hexdigest() !=
+            entry['prefix_sha1']):
+        return None
+    header, kinds = entry['header'], entry['kinds']
+    where = dict((header.index(name), keep) for name, keep in
+                 obslog_where(exclude, drop_closed, sources).items()
+                 if name in header)
+    columns = _read_columns(columns)
+    if columns is not None:
+        columns = _select_columns(header, columns)
+        header = [header[col] for col in columns]
+    if len(kinds) != len(header):
+        return None
+    try:
+        rows = parse_obslog_rows(_decode(data[offset:_rows_end(data)]),
+                                 where, columns, len(entry['header']))
+        df = obslog_frame(header, rows, kinds)
+    except (OverflowError, ValueError):
+        return None
+    print('Reading obslog: {} (+{} rows)'.format(filename, len(rows)))
+    df.index += entry['nrows']
+    return clean_obslog(df, exclude, drop_closed, sources), len(rows)
+
+
+def update_log_entry(filename, entry=None, **kwargs):
+    '''Bring the parse state of a html obslog up to date
+
+    An obslog that only had rows appended since entry was made (the html
+    up to the end of the last parsed row is unchanged) is updated by
+    parsing just the new rows. Otherwise the whole obslog is parsed.
 
     Parameters
     ----------
-    dir : string (optional)
-        Directory with html log files, defaults to ~/obslogs/
+    filename : string
+        obslog html file
+    entry : dict (optional)
+        Previous parse state of filename from update_log_entry
+    **kwargs
+        Passed on to read_one_log
+
+    Returns
+    -------
+    entry : dict
+        Parse state: size, mtime and sha1 of the html file, the header,
+        types of the read columns, number of rows and end offset of the
+        parsed rows (and sha1 up to it, offset -1 if not parsed by the
+        fast parser), and the obslog data as df
+    rows : pandas.DataFrame or None
+        The new obslog data (all of it if not appended), None if unchanged
+    appended : bool
+        Whether rows were appended to entry['df']
+    '''
+
+    stat = os.stat(filename)
+    if (entry is not None and entry['size'] == stat.st_size and
+            entry['mtime'] == stat.st_mtime):
+        return entry, None, False
+    with open(filename, 'rb') as f:
+        data = f.read()
+    sha1 = hashlib.sha1(data).hexdigest()
+    if entry is not None and entry['sha1'] == sha1:
+        entry.update(size=stat.st_size, mtime=stat.st_mtime)
+        return entry, None, False
+
+    offset = _rows_end(data)
+    tail = None if entry is None else _read_tail(filename, data, entry,
+                                                 **kwargs)
+    if tail is not None:
+        rows, nrows = tail
+        if len(rows):
+            entry['df'] = pd.concat([entry['df'], rows], axis=0)
+        entry['nrows'] += nrows
+        appended = True
+    else:
+        where = obslog_where(kwargs.get('exclude'),
+                             kwargs.get('drop_closed', False),
+                             kwargs.get('sources'))
+        columns = _read_columns(kwargs.get('columns'))
+        table = None
+        if kwargs.get('parser', 'fast') == 'fast' and offset >= 0:
+            # only the complete rows, up to offset, so that rows still
+            # being written are parsed with the appended ones
+            try:
+                header, table = parse_obslog_table(
+                    _decode(data[:offset]) + '</table>', where, columns)
+            except ValueError:
+                pass
+            else:
+                table = obslog_frame(header, table)
+        if table is None:
+            # no tail parsing after a pandas.read_html parse
+            offset = -1
+            table = read_obslog_table(filename, 'pandas', data, where,
+                                      columns)
+        entry = {'header': _read_header(data) or list(table.columns),
+                 'nrows': table.index[-1] + 1 if len(table) else 0,
+                 'kinds': [(dtype.kind if dtype.kind in 'if' else 'O')
+                           if len(table) else None
+                           for dtype in table.dtypes]}
+        print('Reading obslog:', filename)
+        rows = clean_obslog(table, kwargs.get('exclude'),
+                            kwargs.get('drop_closed', False),
+                            kwargs.get('sources'))
+        entry['df'] = rows
+        appended = False
+    entry.update(size=stat.st_size, mtime=stat.st_mtime, sha1=sha1,
+                 offset=offset,
+                 prefix_sha1=hashlib.sha1(data[:max(offset, 0)]).hexdigest())
+    return entry, rows, appended
+
+
+def _cache_file(filename, options, cache_dir):
+    '''Cache file name for an obslog and its read_one_log options'''
+    key = repr((CACHE_VERSION, os.path.abspath(filename),
+                sorted(options.items())))
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl'
+    return os.path.join(cache_dir, name)
+
+
+def read_cached_log(filename, cache_dir=None, rebuild=False, **kwargs):
+    '''Read a html obslog via the on-disk parse cache
+
+    The parse state of update_log_entry, including the DataFrame, is
+    pickled to one file per obslog (and per read_one_log options other
+    than sources) in cache_dir. An unchanged obslog is loaded from the
+    cache, rows appended to a growing obslog (e.g. tonight's) are parsed
+    on their own and a new or rewritten obslog is parsed in full and
+    re-cached. Sources are selected from the cached data, so the same
+    cache entries serve any sources.
+
+    Parameters
+    ----------
+    filename : string
+        obslog html file
+    cache_dir : string (optional)
+        Cache directory, defaults to CACHE_DIR (~/.cache/apexlog/)
+    rebuild : bool (optional)
+        Ignore an existing cache entry and re-parse the obslog
+    **kwargs
+        Passed on to read_one_log
 
     Returns
     -------
@@ -124,26 +725,715 @@ def read_obslogs(dir=None):
         The obslog data
     '''
 
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    sources = kwargs.pop('sources', None)
+    cached = _cache_file(filename, kwargs, cache_dir)
+    entry = None if rebuild else _read_cache(cached)
+    size_mtime = None if entry is None else (entry['size'], entry['mtime'])
+    entry, rows, appended = update_log_entry(filename, entry, **kwargs)
+    if (entry['size'], entry['mtime']) != size_mtime:
+        _write_cache(cached, entry)
+    return _select_sources(entry['df'], sources)
+
+
+def _select_sources(df, sources):
+    '''Copy of obslog data (see clean_obslog) of sources, all if None'''
+    if sources is None:
+        return df.copy()
+    return df[df.Source.isin(sources)]
+
+
+def _read_cache(cached):
+    '''Read a cache entry, None if missing or unreadable'''
+    if not os.path.exists(cached):
+        return None
+    try:
+        with open(cached, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def _write_cache(cached, entry):
+    '''Atomically write a cache entry'''
+    cache_dir = os.path.dirname(cached)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp = '{}.{}.tmp'.format(cached, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cached)
+
+
+def _log_range(filename):
+    '''UTC and scan number range of a html obslog, empty if no scans'''
+    df = read_obslog_table(filename, columns=['utc', 'scan'])
+    if not len(df):
+        return {}
+    utc = parse_utc(df.UTC)
+    return {'utc_min': str(utc.min()), 'utc_max': str(utc.max()),
+            'scan_min': int(df.Scan.min()), 'scan_max': int(df.Scan.max())}
+
+
+def obslog_manifest(logs, manifest=None):
+    '''UTC and scan number range of html obslogs
+
+    The ranges are kept in a JSON manifest with the size/mtime of each
+    obslog, only new or modified obslogs are read (UTC/Scan columns only).
+
+    Parameters
+    ----------
+    logs : list
+        obslog html files
+    manifest : string (optional)
+        Manifest file, defaults to MANIFEST (~/.cache/apexlog/manifest.json)
+
+    Returns
+    -------
+    ranges : dict
+        By obslog: size, mtime, utc_min/utc_max (ISO format) and
+        scan_min/scan_max, without the ranges for obslogs without scans
+    '''
+
+    if manifest is None:
+        manifest = MANIFEST
+    index = {}
+    if os.path.exists(manifest):
+        try:
+            with open(manifest) as f:
+                index = json.load(f)
+        except ValueError:
+            pass
+    if index.get('version') != MANIFEST_VERSION:
+        index = {'version': MANIFEST_VERSION, 'logs': {}}
+
+    ranges, changed = {}, False
+    for log in logs:
+        path = os.path.abspath(log)
+        stat = os.stat(path)
+        entry = index['logs'].get(path)
+        if (entry is None or entry['size'] != stat.st_size or
+                entry['mtime'] != stat.st_mtime):
+            entry = dict(_log_range(path), size=stat.st_size,
+                         mtime=stat.st_mtime)
+            index['logs'][path] = entry
+            changed = True
+        ranges[log] = entry
+
+    if changed:
+        if not os.path.isdir(os.path.dirname(manifest)):
+            os.makedirs(os.path.dirname(manifest))
+        tmp = '{}.{}.tmp'.format(manifest, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, manifest)
+    return ranges
+
+
+def find_obslogs(dir=None, since=None, until=None):
+    '''html obslogs in dir, with scans between since and until if given
+
+    Parameters
+    ----------
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    since, until : pandas.Timestamp (optional)
+        Only obslogs with scans since <= UTC < until, by obslog_manifest
+
+    Returns
+    -------
+    logs : list
+        obslog html files in name order
+    '''
+
     if dir is None:
         dir = expanduser('~/obslogs/')
-    logs = glob(dir + '*.html')
+    logs = sorted(glob(dir + '*.html'))
+    if since is None and until is None:
+        return logs
+    return _logs_in_range(logs, since, until)
+
+
+def _logs_in_range(logs, since, until):
+    '''obslogs with scans since <= UTC < until, by obslog_manifest'''
+    ranges = obslog_manifest(logs)
+    return [log for log in logs if 'utc_min' in ranges[log] and
+            (since is None or pd.Timestamp(ranges[log]['utc_max']) >= since)
+            and
+            (until is None or pd.Timestamp(ranges[log]['utc_min']) < until)]
+
+
+def _naive_utc(value):
+    '''pandas.Timestamp of value in UTC without time zone, None if None'''
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+    return value
+
+
+def time_range(since=None, until=None, night=None):
+    '''UTC range of --since/--until/--night options
+
+    A night is from 12:00 UTC of its date to 12:00 UTC the next day.
+
+    Returns
+    -------
+    since, until : pandas.Timestamp or None
+        As UTC without time zone, like the obslog UTC
+    '''
+    since = _naive_utc(since)
+    until = _naive_utc(until)
+    if night is not None:
+        start = _naive_utc(night).normalize() + pd.Timedelta(hours=12)
+        since = start if since is None else max(since, start)
+        end = start + pd.Timedelta(days=1)
+        until = end if until is None else min(until, end)
+    return since, until
+
+
+def time_slice(df, since=None, until=None):
+    '''Scans of df with since <= utc < until
+
+    A df sorted by utc (as obslogs usually are) is sliced by binary
+    search, otherwise masked.
+    '''
+    if since is None and until is None:
+        return df
+    utc = df.utc
+    if utc.is_monotonic_increasing:
+        start = 0 if since is None else utc.searchsorted(since)
+        stop = len(df) if until is None else utc.searchsorted(until)
+        return df.iloc[start:stop]
+    mask = np.ones(len(df), dtype=bool)
+    if since is not None:
+        mask &= (utc >= since).values
+    if until is not None:
+        mask &= (utc < until).values
+    return df[mask]
+
+
+def split_mol_line(mol_line):
+    '''Line names and frequencies of obslog 'Mol. line' entries
+
+    Entries like 'CO(2-1) (230.538); CO(2-1) (230.538)' are split by
+    MOL_LINE_RE. Each distinct entry is parsed once and the results are
+    taken by the entry codes, as there are few lines per obslog.
+
+    Parameters
+    ----------
+    mol_line : pandas.Series
+        'Mol. line' column
+
+    Returns
+    -------
+    lines : pandas.DataFrame
+        line/freq_ghz of the first and line2/freq2_ghz of the second
+        entry (NaN if missing), with the index of mol_line
+    '''
+
+    codes, uniques = pd.factorize(mol_line)
+    dtype = uniques.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        # e.g. compact_obslog data, the line names are not categories
+        dtype = dtype.categories.dtype
+    matches = [MOL_LINE_RE.match(str(entry)) for entry in uniques]
+    parts = [[np.nan] * 4 if match is None else
+             [np.nan if part is None else part for part in match.groups()]
+             for match in matches]
+    columns = {}
+    for i, col in enumerate(LINE_COLUMNS):
+        values = [part[i] for part in parts]
+        if col.startswith('freq'):
+            values = np.array([_frequency(value) for value in values])
+        else:
+            # line names in the string dtype of mol_line
+            values = pd.array(values, dtype=dtype)
+        # code -1 (missing entry) is NaN
+        columns[col] = pd.api.extensions.take(values, codes, allow_fill=True)
+    return pd.DataFrame(columns, index=mol_line.index, columns=LINE_COLUMNS)
+
+
+def _frequency(text):
+    '''Frequency [GHz] of a 'Mol. line' entry, NaN if none'''
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def normalise_obslog(df):
+    '''obslog data with line name/frequency columns and renamed columns
+
+    Column names are lower case with '_' for blanks, e.g. 'Mol. line' to
+    'mol_line', as used throughout apexlog. See split_mol_line for the
+    line, freq_ghz, line2 and freq2_ghz columns. Returns a new DataFrame.
+    '''
+    df = pd.concat([df, split_mol_line(df['Mol. line'])], axis=1)
+    df.rename(columns=_column_name, inplace=True)
+    return df
+
+
+def iter_obslogs(dir=None, cache=True, rebuild=False, jobs=1, logs=None,
+                 profile=None, since=None, until=None, **kwargs):
+    '''Iterate over APEX html obslogs
+
+    Yields one normalised DataFrame per obslog, in file name order, so
+    summaries can be aggregated without holding all obslogs in memory.
+    With jobs > 1 the obslogs are parsed ahead in a pool of worker
+    processes.
+
+    Parameters
+    ----------
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    cache : bool (optional)
+        Use the on-disk parse cache for unchanged obslogs
+    rebuild : bool (optional)
+        Re-parse all obslogs and rebuild their cache entries
+    jobs : int (optional)
+        Number of worker processes, 0 for one per CPU, defaults to 1
+    logs : list (optional)
+        obslog files to read instead of all html files in dir
+    profile : StageProfile (optional)
+        Profile reading each obslog as a stage (if jobs == 1)
+    since, until : pandas.Timestamp (optional)
+        Only scans since <= UTC < until, obslogs without any are skipped
+        (see find_obslogs)
+    **kwargs
+        Passed on to read_one_log
+
+    Yields
+    ------
+    df : pandas.DataFrame
+        The data of one obslog
+    '''
+
+    if logs is None:
+        logs = find_obslogs(dir, since, until)
+
+    if cache:
+        read_log = partial(read_cached_log, rebuild=rebuild, **kwargs)
+    else:
+        read_log = partial(read_one_log, **kwargs)
+
+    if jobs != 1 and len(logs) > 1:
+        pool = multiprocessing.Pool(jobs or None)
+        try:
+            for df in pool.imap(read_log, logs):
+                yield time_slice(normalise_obslog(df), since, until)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for log in logs:
+            with profile_stage(profile, os.path.basename(log)):
+                df = time_slice(normalise_obslog(read_log(log)), since, until)
+            yield df
+
+
+def compact_obslog(df, verbose=True):
+    '''Convert obslog columns to compact dtypes, in place
+
+    Low cardinality string columns (CATEGORY_COLUMNS) become categoricals
+    and weather/pointing columns (FLOAT32_COLUMNS) float32. Group by
+    categorical columns with observed=True.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The obslog data
+    verbose : bool (optional)
+        Print memory usage before/after
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog data
+    '''
+
+    before = df.memory_usage(deep=True).sum()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns and df[col].dtype.kind == 'f':
+            df[col] = df[col].astype(np.float32)
+    if verbose:
+        after = df.memory_usage(deep=True).sum()
+        print('Compacted obslog data: {:.1f} MB -> {:.1f} MB'.format(
+            before / 2**20, after / 2**20))
+    return df
+
+
+def read_obslogs(dir=None, cache=True, rebuild=False, jobs=1, compact=False,
+                 profile=None, **kwargs):
+    '''Read APEX html obslogs
+
+    With jobs > 1 the obslogs are parsed in a pool of worker processes.
+    The result is the same as a serial read: logs are merged in file name
+    order and stably sorted by UTC.
+
+    Parameters
+    ----------
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    cache : bool (optional)
+        Use the on-disk parse cache for unchanged obslogs
+    rebuild : bool (optional)
+        Re-parse all obslogs and rebuild their cache entries
+    jobs : int (optional)
+        Number of worker processes, 0 for one per CPU, defaults to 1
+    compact : bool (optional)
+        Use categorical/float32 columns, see compact_obslog
+    profile : StageProfile (optional)
+        Profile reading each obslog and merging as stages
+    **kwargs
+        Passed on to iter_obslogs (since/until) and read_one_log, e.g.
+        sources or columns
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog data
+    '''
 
     print('')
-    df = read_one_log(logs[0])
-    for log in logs[1:]:
-        df = pd.concat([df, read_one_log(log)], axis=0)
-    df['Line'] = df['Mol. line'].apply(get_line_name)
-    df.rename(columns=(lambda x: re.sub('[().]', '', x)), inplace=True)
-    df.rename(columns=(lambda x: re.sub('[ -]', '_', x)), inplace=True)
-    df.rename(columns=(lambda x: x.lower()), inplace=True)
-    df.set_index('utc', inplace=True)
-    df.sort_index(inplace=True)
-    df.reset_index(inplace=True)
+    frames = list(iter_obslogs(dir, cache=cache, rebuild=rebuild, jobs=jobs,
+                               profile=profile, **kwargs))
+    if not frames:
+        raise ValueError('No obslogs to read')
+    with profile_stage(profile, 'merge obslogs'):
+        df = pd.concat(frames, axis=0)
+        df.set_index('utc', inplace=True)
+        df.sort_index(inplace=True, kind='mergesort')
+        df.reset_index(inplace=True)
+        if compact:
+            compact_obslog(df)
     return df
 
 
-def summarise_sciobs(sci_sources, sci_lines, df):
-    '''Summarise science observations in DataFrame
+def load_store(store=STORE, compact=False):
+    '''Load the consolidated obslog store
+
+    Parameters
+    ----------
+    store : string (optional)
+        Parquet obslog store written by update_store
+    compact : bool (optional)
+        Use categorical/float32 columns, see compact_obslog
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog data, as returned by read_obslogs
+    '''
+
+    import pyarrow.parquet as pq
+    df = pq.read_table(store).to_pandas()
+    df.drop(columns='obslog', inplace=True)
+    if compact:
+        compact_obslog(df)
+    return df
+
+
+def update_store(store=STORE, dir=None, compact=False, **kwargs):
+    '''Update the consolidated obslog store with new/modified obslogs
+
+    The store is a Parquet file of all obslog data, with an extra obslog
+    column naming the html file of each scan and the size/mtime of the
+    stored obslogs in the file metadata. Only obslogs that are new or
+    modified since the last update are read and merged, rows of removed
+    obslogs are dropped. An up to date store is not rewritten.
+
+    Parameters
+    ----------
+    store : string (optional)
+        Parquet obslog store, defaults to STORE (apexlog.parquet)
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    compact : bool (optional)
+        Use categorical/float32 columns, see compact_obslog
+    **kwargs
+        Passed on to iter_obslogs/read_one_log
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The obslog data, as returned by read_obslogs
+    '''
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    logs = [os.path.abspath(log) for log in find_obslogs(dir)]
+    stats = {}
+    for log in logs:
+        stat = os.stat(log)
+        stats[log] = [stat.st_size, stat.st_mtime]
+    options = dict((k, v) for k, v in kwargs.items()
+                   if k not in ('cache', 'rebuild', 'jobs', 'profile'))
+    options = json.loads(json.dumps(options))
+
+    old, stored = None, {}
+    if os.path.exists(store):
+        table = pq.read_table(store)
+        meta = json.loads((table.schema.metadata or {}).get(b'apexlog',
+                                                            b'{}'))
+        if (meta.get('version') == STORE_VERSION and
+                meta.get('options') == options):
+            old, stored = table.to_pandas(), meta['logs']
+    new = [log for log in logs if stored.get(log) != stats[log]]
+    removed = set(stored) - set(stats)
+
+    if old is not None and not new and not removed:
+        print('\nObslog store up to date:', store)
+        df = old
+    else:
+        print('')
+        frames = []
+        if old is not None:
+            frames.append(old[~old.obslog.isin(set(new) | removed)])
+        for log, frame in zip(new, iter_obslogs(logs=new, **kwargs)):
+            frame['obslog'] = log
+            frames.append(frame)
+        df = pd.concat(frames, axis=0, ignore_index=True)
+        df = df[['utc'] + [c for c in df.columns if c != 'utc']]
+        df.sort_values(['utc', 'obslog'], kind='mergesort', inplace=True,
+                       ignore_index=True)
+
+        meta = {'version': STORE_VERSION, 'options': options, 'logs': stats}
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(dict(
+            table.schema.metadata or {}, apexlog=json.dumps(meta)))
+        tmp = '{}.{}.tmp'.format(store, os.getpid())
+        pq.write_table(table, tmp)
+        os.replace(tmp, store)
+        print('Updated obslog store: {} ({} obslogs read)'.format(
+            store, len(new)))
+
+    df = df.drop(columns='obslog')
+    if compact:
+        compact_obslog(df)
+    return df
+
+
+def _add_sums(dfs, part):
+    '''Add grouped scan duration sums, None being empty'''
+    if dfs is None:
+        return part
+    return dfs.add(part, fill_value=pd.Timedelta(0))
+
+
+def running_sum(frames, by, select=None):
+    '''Sum scan duration by columns, one obslog frame at a time
+
+    Parameters
+    ----------
+    frames : iterable of pandas.DataFrame
+        Obslog data, e.g. from iter_obslogs
+    by : list
+        Columns to group by
+    select : callable (optional)
+        Function of a frame returning a boolean mask of the rows to sum
+
+    Returns
+    -------
+    dfs : pandas.DataFrame or None
+        Sum of scan_duration by the group columns, None without frames
+    '''
+
+    dfs = None
+    for df in frames:
+        if select is not None:
+            df = df[select(df)]
+        dfs = _add_sums(dfs, df.groupby(by, observed=True)[['scan_duration']]
+                        .sum())
+    return None if dfs is None else dfs.sort_index()
+
+
+class ObslogSummary(object):
+    '''Sum of scan duration over obslogs, updated as scans arrive
+
+    Keeps the parse state (see update_log_entry) and the grouped scan
+    duration of each obslog. An update parses and aggregates only the rows
+    appended to an obslog since the last update, and new or rewritten
+    obslogs. The parse cache is used and kept up to date.
+
+    Parameters
+    ----------
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    by : list (optional)
+        Columns to group by, defaults to scan_status/source/line
+    select : callable (optional)
+        Function of a frame returning a boolean mask of the rows to sum
+    since, until : pandas.Timestamp (optional)
+        Only sum scans since <= UTC < until
+    **kwargs
+        Passed on to read_one_log
+    '''
+
+    def __init__(self, dir=None, by=None, select=None, since=None,
+                 until=None, **kwargs):
+        if dir is None:
+            dir = expanduser('~/obslogs/')
+        if by is None:
+            by = ['scan_status', 'source', 'line']
+        self.dir = dir
+        self.by = by
+        self.select = select
+        self.since = since
+        self.until = until
+        # selected from the parsed obslogs, see read_cached_log
+        self.sources = kwargs.pop('sources', None)
+        self.kwargs = kwargs
+        self.entries = {}
+        self.sums = {}
+
+    def update(self):
+        '''Read new scans, returns the list of changed obslogs'''
+        logs = find_obslogs(self.dir)
+        if self.since is not None or self.until is not None:
+            # obslogs already read are kept without reading them again
+            # for their UTC range (time_slice selects their scans)
+            new = set(_logs_in_range([log for log in logs
+                                      if log not in self.entries],
+                                     self.since, self.until))
+            logs = [log for log in logs
+                    if log in self.entries or log in new]
+        changed = []
+        for log in logs:
+            cached = _cache_file(log, self.kwargs, CACHE_DIR)
+            entry = self.entries.get(log)
+            if entry is None:
+                entry = _read_cache(cached)
+            size_mtime = None if entry is None else (entry['size'],
+                                                     entry['mtime'])
+            entry, rows, appended = update_log_entry(log, entry,
+                                                     **self.kwargs)
+            self.entries[log] = entry
+            if (entry['size'], entry['mtime']) != size_mtime:
+                _write_cache(cached, entry)
+            if rows is None and log in self.sums:
+                continue
+            # rows appended to a cached entry are not in self.sums yet
+            appended = appended and log in self.sums
+            if not appended:
+                rows = entry['df']
+            rows = time_slice(normalise_obslog(_select_sources(
+                rows, self.sources)), self.since, self.until)
+            part = running_sum([rows], self.by, self.select)
+            if appended:
+                part = _add_sums(self.sums[log], part)
+            self.sums[log] = part
+            changed.append(log)
+        for log in set(self.entries) - set(logs):
+            del self.entries[log], self.sums[log]
+            changed.append(log)
+        return changed
+
+    def total(self):
+        '''Sum of scan_duration by the group columns over all obslogs'''
+        dfs = None
+        for log in sorted(self.sums):
+            dfs = _add_sums(dfs, self.sums[log])
+        return None if dfs is None else dfs.sort_index()
+
+    def watch(self, show, interval=10):
+        '''Update every interval seconds, calling show(self) on changes
+
+        Runs until interrupted (Ctrl-C).
+        '''
+        try:
+            while True:
+                if self.update():
+                    show(self)
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print('')
+
+
+def match_lines(freq_ghz, sci_lines, tol=0.001):
+    '''Catalogue lines of scans by frequency
+
+    The catalogue frequencies are sorted once and each scan frequency is
+    located by binary search (numpy.searchsorted), so matching costs
+    O(log n) per scan for n catalogue lines.
+
+    Parameters
+    ----------
+    freq_ghz : array-like
+        Scan line frequencies [GHz], e.g. the freq_ghz column
+    sci_lines : dict
+        Frequency [GHz] of science lines by name, see read_linecat
+    tol : float (optional)
+        Largest frequency difference [GHz] of a match, defaults to 1 MHz
+
+    Returns
+    -------
+    lines : numpy.ndarray
+        Name of the nearest catalogue line within tol, NaN if none
+    '''
+
+    names = np.array(list(sci_lines), dtype=object)
+    freqs = np.array([sci_lines[name] for name in names], dtype=float)
+    order = np.argsort(freqs, kind='mergesort')
+    names, freqs = names[order], freqs[order]
+    freq_ghz = np.asarray(freq_ghz, dtype=float)
+    lines = np.full(len(freq_ghz), np.nan, dtype=object)
+    if not len(freqs):
+        return lines
+    right = np.searchsorted(freqs, freq_ghz).clip(0, len(freqs) - 1)
+    left = (right - 1).clip(0)
+    nearest = np.where(np.abs(freq_ghz - freqs[left]) <=
+                       np.abs(freqs[right] - freq_ghz), left, right)
+    matched = np.abs(freq_ghz - freqs[nearest]) <= tol
+    lines[matched] = names[nearest[matched]]
+    return lines
+
+
+def catalogue_lines(df, sci_lines, tol=0.001):
+    '''obslog data with line set to the catalogue line of its frequency
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The obslog data
+    sci_lines : dict
+        Frequency [GHz] of science lines by name, see read_linecat
+    tol : float (optional)
+        Largest frequency difference [GHz], see match_lines
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        New DataFrame with line the catalogue line within tol of freq_ghz
+        (NaN if none) and the obslog line name as obs_line
+    '''
+
+    return df.assign(obs_line=df.line,
+                     line=match_lines(df.freq_ghz, sci_lines, tol))
+
+
+def science_mask(sci_sources, sci_lines, df):
+    '''Mask of "ON" (ONOFF/OTF) scans of science sources/lines in df'''
+    on_types = ['ONOFF', 'OTF']
+    return (df.source.isin(sci_sources)
+            & df.line.isin(sci_lines)
+            & df.scan_type.isin(on_types))
+
+
+class ScienceSelection(object):
+    '''"ON" scans of science sources/lines in obslog data, selected once
+
+    Holds the science_mask of the obslog data and the positions of the
+    selected scans, shared by the summary and the plots. Columns of the
+    selected scans are taken as needed, without copying the frame, and
+    groupings (e.g. by source/line) are factorized once and reused by
+    every aggregation.
 
     Parameters
     ----------
@@ -153,6 +1443,83 @@ def summarise_sciobs(sci_sources, sci_lines, df):
         List or dictionary of science lines
     df : pandas.DataFrame
         The obslog data
+    '''
+
+    def __init__(self, sci_sources, sci_lines, df):
+        self.df = df
+        self.mask = science_mask(sci_sources, sci_lines, df).values
+        self.index = np.flatnonzero(self.mask)
+        self.groupings = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def column(self, name):
+        '''Column name of the selected scans, as pandas.Series'''
+        return self.df[name].take(self.index)
+
+    def grouping(self, by=('source', 'line')):
+        '''Group codes of the selected scans and the groups (sorted)'''
+        by = tuple(by)
+        if by not in self.groupings:
+            keys = pd.MultiIndex.from_arrays(
+                [self.column(col).values for col in by], names=by)
+            codes, groups = keys.factorize(sort=True)
+            groups.names = by
+            self.groupings[by] = codes, groups
+        return self.groupings[by]
+
+    def agg(self, name, func, by=('source', 'line')):
+        '''Aggregate column name of the selected scans by the columns by
+
+        Parameters
+        ----------
+        name : string
+            Column to aggregate
+        func : string, callable or list
+            Aggregation(s), as for pandas.Series.groupby(...).agg
+        by : list (optional)
+            Columns to group by, defaults to source/line
+
+        Returns
+        -------
+        result : pandas.Series or pandas.DataFrame
+            The aggregate(s) indexed by the by columns
+        '''
+
+        codes, groups = self.grouping(by)
+        result = self.column(name).groupby(codes).agg(func)
+        result.index = groups.take(result.index.values)
+        return result
+
+
+def duration_minutes(dfs):
+    '''Summed scan_duration as 'Duration [min]' column, empty if dfs None'''
+    if dfs is None:
+        return pd.DataFrame({'Duration [min]': []}, dtype=float)
+    dfs = dfs.copy()
+    dfs['Duration [min]'] = (dfs['scan_duration'] /
+                             np.timedelta64(1, 'm')).round(1)
+    return dfs[['Duration [min]']]
+
+
+def summarise_sciobs(sci_sources, sci_lines, df, tol=None):
+    '''Summarise science observations in DataFrame
+
+    Parameters
+    ----------
+    sci_sources : list
+        List of science sources
+    sci_lines : list/dict
+        List or dictionary of science lines
+    df : pandas.DataFrame, iterable of pandas.DataFrame or ScienceSelection
+        The obslog data, obslog frames e.g. from iter_obslogs, or the
+        science scans already selected from the obslog data
+    tol : float (optional)
+        Match scans to the sci_lines dict by frequency within tol [GHz]
+        (see catalogue_lines), rather than by line name; raises
+        ValueError for a ScienceSelection, select from the frame returned
+        by catalogue_lines instead
 
     Returns
     -------
@@ -160,17 +1527,105 @@ def summarise_sciobs(sci_sources, sci_lines, df):
         Summary of scan duration [min] for sources/lines
     '''
 
+    if isinstance(df, ScienceSelection) and tol is not None:
+        raise ValueError('tol does not work with a ScienceSelection, '
+                         'select the scans of catalogue_lines(df, ...)')
     print('\nSummarising scan duration by science sources/lines:')
-    on_types = ['ONOFF', 'OTF']
-    dfs = pd.DataFrame(df[df.source.isin(sci_sources)
-                          & df.line.isin(sci_lines)
-                          & df.scan_type.isin(on_types)
-                          ]
-                       )
-    dfs = dfs.groupby(['source', 'line'])[['scan_duration']].sum()
-    dfs['Duration [min]'] = (dfs['scan_duration'] /
-                             np.timedelta64(1, 'm')).round(1)
-    return dfs[['Duration [min]']]
+    if isinstance(df, ScienceSelection):
+        return duration_minutes(df.agg('scan_duration', 'sum').to_frame())
+    if isinstance(df, pd.DataFrame):
+        df = [df]
+    if tol is not None:
+        df = (catalogue_lines(frame, sci_lines, tol) for frame in df)
+    dfs = running_sum(df, ['source', 'line'],
+                      select=partial(science_mask, sci_sources, sci_lines))
+    return duration_minutes(dfs)
+
+
+class StageProfile(object):
+    '''Wall time, CPU time and peak memory of named run stages
+
+    Stages can be nested, e.g. one stage per obslog inside the ingestion
+    stage. Peak memory is the tracemalloc peak above the memory allocated
+    at the start of the stage; tracing slows down allocation heavy stages
+    somewhat. With cprofile=True each top level stage is also run under
+    cProfile, see dump.
+    '''
+
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        self.stages = []
+        self._stack = []
+        self._profiles = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''Context manager profiling the enclosed code as stage name'''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        record = {'stage': name, 'depth': len(self._stack)}
+        self.stages.append(record)
+        start, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # keep the peak of the enclosing stage before resetting it
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame = {'peak': 0}
+        self._stack.append(frame)
+        profile = None
+        if self.cprofile and record['depth'] == 0:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+                self._profiles[len(self.stages) - 1] = profile
+            self._stack.pop()
+            peak = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+            record['peak_mb'] = (peak - start) / 2**20
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            else:
+                tracemalloc.stop()
+
+    def table(self):
+        '''Stages as a DataFrame'''
+        df = pd.DataFrame(self.stages,
+                          columns=['stage', 'depth', 'wall', 'cpu',
+                                   'peak_mb'])
+        df['stage'] = ['  ' * depth + stage
+                       for stage, depth in zip(df.stage, df.depth)]
+        df.columns = ['Stage', 'depth', 'Wall [s]', 'CPU [s]',
+                      'Peak [MB]']
+        return df.drop(columns='depth').set_index('Stage').round(3)
+
+    def write(self, filename):
+        '''Write stages as JSON'''
+        with open(filename, 'w') as f:
+            json.dump(self.stages, f, indent=1)
+        print('Wrote profile:', filename)
+
+    def dump(self, filename):
+        '''Write the cProfile stats of the slowest top level stage'''
+        if not self._profiles:
+            return
+        i = max(self._profiles, key=lambda i: self.stages[i]['wall'])
+        self._profiles[i].dump_stats(filename)
+        print('Wrote cProfile stats of stage "{}": {}'.format(
+            self.stages[i]['stage'], filename))
+
+
+def profile_stage(profile, name):
+    '''profile.stage(name), or a no-op context if profile is None'''
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.stage(name)
 
 
 def parse_inputs():
@@ -181,11 +1636,98 @@ def parse_inputs():
                         help='Location/basename of source and line catalogs')
     parser.add_argument('-o', '--obslogs', type=str,
                         help='Location of html obslogs')
+    parser.add_argument('--since', type=str, metavar='UTC',
+                        help='Only scans since UTC (date or date/time)')
+    parser.add_argument('--until', type=str, metavar='UTC',
+                        help='Only scans before UTC (date or date/time)')
+    parser.add_argument('--night', type=str, metavar='DATE',
+                        help='Only scans of the night starting on DATE '
+                             '(12:00 to 12:00 UTC)')
+    parser.add_argument('--match-freq', type=float, nargs='?', const=1.,
+                        metavar='MHZ',
+                        help='Match scans to catalogue lines by frequency '
+                             'within MHZ (default 1), not by name')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the obslog parse cache')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Re-parse all obslogs and rebuild the cache')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Parse obslogs (and plot --batch projects) in '
+                             'N processes, 0 for all CPUs')
+    parser.add_argument('--parser', choices=['fast', 'pandas'],
+                        default='fast',
+                        help='obslog table parser, defaults to fast')
+    parser.add_argument('--compact', action='store_true',
+                        help='Use categorical/float32 columns')
+    parser.add_argument('--store', type=str, default=STORE,
+                        help='Parquet obslog store, defaults to ' + STORE)
+    parser.add_argument('--no-store', action='store_true',
+                        help='Do not read/update the obslog store')
+    parser.add_argument('--all-columns', action='store_true',
+                        help='Read all obslog columns, not only the ones '
+                             'summarised/plotted')
+    parser.add_argument('--csv', type=str, nargs='?', const='apexlog.csv',
+                        help='Also export the obslog data (all columns) '
+                             'to csv')
+    parser.add_argument('-w', '--watch', type=float, nargs='?', const=10.,
+                        metavar='SECONDS',
+                        help='Update the summary as scans arrive')
+    parser.add_argument('--no-plot', '--summary-only', action='store_true',
+                        help='Only print the summary, no apexlog.png')
+    parser.add_argument('--batch', type=str, nargs='+', metavar='CATALOGS',
+                        help='Summarise/plot each project (catalog '
+                             'basename or glob) from one read of the '
+                             'obslogs, to <project>.csv/png')
+    parser.add_argument('--batch-dir', type=str, default='.', metavar='DIR',
+                        help='Directory for the --batch csv/png files')
+    parser.add_argument('--replot', action='store_true',
+                        help='Plot apexlog.png even if its inputs did not '
+                             'change')
+    parser.add_argument('--all-scans', action='store_true',
+                        help='Plot every scan in the PWV time series, '
+                             'not one per few pixels')
+    parser.add_argument('--pwv-quantiles', type=float, nargs='+',
+                        metavar='Q',
+                        help='Mark PWV quantiles (0-1) on the cumulative '
+                             'PWV plot')
+    parser.add_argument('--profile', type=str, nargs='?', const='-',
+                        metavar='JSON',
+                        help='Print time/memory per stage, or write JSON')
+    parser.add_argument('--profile-dump', type=str, metavar='FILE',
+                        help='Write cProfile stats of the slowest stage')
     args = parser.parse_args()
-    return args.catalogs, args.obslogs
+    if args.watch and args.match_freq is not None:
+        parser.error('--match-freq does not work with --watch')
+    if args.watch and args.batch:
+        parser.error('--batch does not work with --watch')
+    return args
+
+
+def report_profile(profile, args):
+    '''Print/write the profile as asked for by --profile/--profile-dump'''
+    if profile is None:
+        return
+    print('\nProfile:')
+    print(profile.table().to_string())
+    if args.profile not in (None, '-'):
+        profile.write(args.profile)
+    if args.profile_dump:
+        profile.dump(args.profile_dump)
+
+
+def pyplot():
+    '''Import matplotlib.pyplot on first use
+
+    matplotlib is only imported for plotting, keeping start-up fast for
+    summaries. The backend is left to matplotlib (matplotlibrc or
+    MPLBACKEND), which falls back to Agg without a display.
+    '''
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def plot_dfs(dfs):
+    plt = pyplot()
     dfs[['Duration [min]']].iloc[::-1].plot.barh(zorder=2, legend=False)
     plt.grid(zorder=0)
     plt.title('Sum of "ON" science source/line scan duration')
@@ -195,16 +1737,159 @@ def plot_dfs(dfs):
     return plt.gcf()
 
 
-def plot_apexlog(sci_sources, sci_lines, df, dfs, eso_id):
+def pwv_series(df):
+    '''UTC and PWV of the obslog scans as arrays, for plot_apexlog
+
+    df is not modified, the UTC array is a view of its column.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The obslog data
+
+    Returns
+    -------
+    utc : numpy.ndarray
+        UTC of the scans as datetime64
+    pwv : numpy.ndarray
+        PWV [mm] of the scans as float, NaN if not positive
+    '''
+
+    utc = df['utc'].to_numpy()
+    pwv = df['mm_pwv'].to_numpy(dtype=float, na_value=np.nan)
+    return utc, np.where(pwv > 0, pwv, np.nan)
+
+
+def pwv_ecdf(pwv):
+    '''Empirical cumulative distribution of PWV
+
+    Parameters
+    ----------
+    pwv : numpy.ndarray
+        PWV [mm], NaN values are ignored
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Distinct PWV values, sorted
+    fraction : numpy.ndarray
+        Fraction of scans with PWV up to each value
+    '''
+
+    values, counts = np.unique(pwv[~np.isnan(pwv)], return_counts=True)
+    fraction = np.cumsum(counts) / max(counts.sum(), 1)
+    return values, fraction
+
+
+def plot_pwv_ecdf(ax, pwv, quantiles=None):
+    '''Plot the cumulative PWV distribution as one step line
+
+    The distribution runs along the PWV (y) axis, as a cumulative
+    histogram with orientation='horizontal', without any binning.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes to plot on
+    pwv : numpy.ndarray
+        PWV [mm], NaN values are ignored
+    quantiles : list (optional)
+        Fractions (0-1) of scans to mark with their PWV
+    '''
+
+    values, fraction = pwv_ecdf(pwv)
+    if not len(values):
+        return
+    ax.plot(np.r_[0, fraction], np.r_[values[0], values],
+            drawstyle='steps-pre')
+    ax.set_xlim(0, 1.05)
+    for q in quantiles or []:
+        value = values[min(np.searchsorted(fraction, q), len(values) - 1)]
+        ax.plot(q, value, 'o', color='C1')
+        ax.annotate('{:.2f} mm'.format(value), (q, value),
+                    xytext=(-4, 4), textcoords='offset points', ha='right',
+                    va='bottom', fontsize=8)
+
+
+def _cells(values, n):
+    '''Index 0..n-1 of equal cells over the range of values'''
+    lo, hi = values.min(), values.max()
+    scale = n / (hi - lo) if hi > lo else 0.
+    return np.minimum(((values - lo) * scale).astype(np.int64), n - 1)
+
+
+def decimate_pwv(utc, pwv, width, height, pixels=3):
+    '''Scans to plot for the PWV time series, at most one per cell
+
+    The time/PWV range is divided into cells of pixels x pixels of a plot
+    width x height pixels large, keeping the first scan in each cell. The
+    plot looks the same (within a cell) as with all scans, but the number
+    of markers is bounded by the number of cells, whatever the number of
+    scans.
+
+    Parameters
+    ----------
+    utc : numpy.ndarray
+        UTC of the scans as datetime64, see pwv_series
+    pwv : numpy.ndarray
+        PWV [mm] of the scans, NaN is not plotted
+    width, height : float
+        Size of the plot [pixels]
+    pixels : float (optional)
+        Size of the cells [pixels]
+
+    Returns
+    -------
+    index : numpy.ndarray
+        Positions of the scans to plot, in order
+    '''
+
+    valid = np.flatnonzero(~np.isnan(pwv) & ~np.isnat(utc))
+    if not len(valid):
+        return valid
+    nx = max(int(width / pixels), 1)
+    ny = max(int(height / pixels), 1)
+    x = _cells(utc[valid].astype('M8[s]').astype(np.int64).astype(float), nx)
+    y = _cells(pwv[valid], ny)
+    first = np.unique(x * ny + y, return_index=True)[1]
+    return valid[np.sort(first)]
+
+
+def plot_header(eso_id):
+    '''Header of the apexlog plot: project ID and today's date (UTC)'''
+    return eso_id + ' by ' + pd.Timestamp.now('UTC').strftime('%Y-%m-%d')
+
+
+def plot_apexlog(df, dfs, eso_id, pwv=None, quantiles=None, decimate=True):
+    '''Plot the science scan duration and the PWV of the obslog scans
+
+    df is not modified, so the same data can be plotted repeatedly.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The obslog data, only used if pwv is not given
+    dfs : pandas.DataFrame
+        Summary by science source/line, see summarise_sciobs
+    eso_id : string
+        Project ID for the header
+    pwv : tuple (optional)
+        UTC and PWV arrays of df, see pwv_series
+    quantiles : list (optional)
+        Fractions of scans to mark on the cumulative PWV distribution
+    decimate : bool (optional)
+        Plot at most one scan per few pixels of the PWV time series (see
+        decimate_pwv), otherwise every scan
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        The figure
+    '''
+
+    plt = pyplot()
+    import matplotlib.gridspec as gridspec
     a = 2
-    on_types = ['ONOFF', 'OTF']
-    science = pd.DataFrame(df[df.source.isin(sci_sources)
-                              & df.line.isin(sci_lines)
-                              & df.scan_type.isin(on_types)
-                              ]
-                           )
-    pwv = science.groupby(['source', 'line']).mm_pwv.describe()
-    pwv = pwv[['mean', 'std']].round(2)
 
     fig = plt.figure(1, figsize=(a * 6.4, a * 4.8))
     gs = gridspec.GridSpec(2, 4, height_ratios=[3, 1],
@@ -213,51 +1898,376 @@ def plot_apexlog(sci_sources, sci_lines, df, dfs, eso_id):
     gs.update(left=0.1, right=0.95, bottom=0.08,
               top=0.90, wspace=0., hspace=0.2)
 
-    now = pd.datetime.utcnow()
-    header = eso_id + ' by ' + now.strftime('%Y-%m-%d')
-    fig.text(0.5, 0.93, header,
+    fig.text(0.5, 0.93, plot_header(eso_id),
              ha='center', va='bottom', fontsize=12, weight='bold')
     ax1 = plt.subplot(gs[0, :])
     ax2 = plt.subplot(gs[1, :-1])
     ax3 = plt.subplot(gs[1, -1], sharey=ax2)
     dfs[['Duration [min]']].iloc[::-1].plot.barh(zorder=2, legend=False,
                                                  ax=ax1)
-    df.loc[df.mm_pwv <= 0, 'mm_pwv'] = np.nan
-    df.set_index('utc', inplace=True)
-    df.mm_pwv.plot(style='o', mfc='none', mew=1, ax=ax2)
-    df.reset_index(inplace=True)
-    df.mm_pwv.plot.hist(bins=np.arange(0, df.mm_pwv.max(), 0.01),
-                        cumulative=True, density=True,
-                        orientation='horizontal')
+    if pwv is None:
+        pwv = pwv_series(df)
+    utc, pwv = pwv
+    if decimate:
+        index = decimate_pwv(utc, pwv, ax2.bbox.width, ax2.bbox.height)
+        ax2.plot(utc[index], pwv[index], 'o', mfc='none', mew=1,
+                 rasterized=True)
+    else:
+        ax2.plot(utc, pwv, 'o', mfc='none', mew=1, rasterized=True)
+    plt.setp(ax2.get_xticklabels(), rotation=30, ha='right')
+    plot_pwv_ecdf(ax3, pwv, quantiles)
 
     ax1.set_title('Sum of "ON" source scan duration by science source/line')
     ax1.set_xlabel('Duration [min]')
     ax1.set_ylabel('')
     ax2.set_ylabel('PWV [mm]')
     ax2.set_xlabel('')
+    ax3.set_xlabel('Fraction of scans')
     for ax in [ax1, ax2, ax3]:
         ax.grid()
     return fig
 
 
+def _digest(*parts):
+    '''SHA-1 hex digest of strings and numpy arrays'''
+    sha = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        else:
+            sha.update(str(part.dtype).encode('ascii'))
+            part = np.ascontiguousarray(part).tobytes()
+        sha.update(part)
+    return sha.hexdigest()
+
+
+def figure_panels(dfs, pwv, header, quantiles=None, decimate=True):
+    '''Content hashes of the inputs of each panel of plot_apexlog
+
+    Parameters
+    ----------
+    dfs : pandas.DataFrame
+        Summary by science source/line, see summarise_sciobs
+    pwv : tuple
+        UTC and PWV arrays, see pwv_series
+    header : string
+        Header of the plot, see plot_header
+    quantiles : list (optional)
+        As for plot_apexlog
+    decimate : bool (optional)
+        As for plot_apexlog
+
+    Returns
+    -------
+    panels : dict
+        Hash by panel name
+    '''
+
+    utc, pwv = pwv
+    return {'header': _digest(header),
+            'duration': _digest(dfs[['Duration [min]']].to_csv()),
+            'pwv time series': _digest(utc, pwv, repr(bool(decimate))),
+            'pwv distribution': _digest(pwv, repr(quantiles))}
+
+
+def _render_index(cache):
+    '''Contents of the render cache, see render_changes'''
+    index = {}
+    if os.path.exists(cache):
+        try:
+            with open(cache) as f:
+                index = json.load(f)
+        except ValueError:
+            pass
+    if index.get('version') != RENDER_VERSION:
+        index = {'version': RENDER_VERSION, 'figures': {}}
+    return index
+
+
+def render_changes(png, panels, cache=None):
+    '''Panels of a plot whose inputs changed since it was saved
+
+    Parameters
+    ----------
+    png : string
+        The saved plot, e.g. apexlog.png
+    panels : dict
+        Hash by panel name of the inputs, see figure_panels
+    cache : string (optional)
+        Render cache, defaults to RENDER_CACHE (~/.cache/apexlog/render.json)
+
+    Returns
+    -------
+    changed : list
+        Names of the changed panels, all if png was not saved with the
+        render cache (or modified since), none if png is up to date
+    '''
+
+    if cache is None:
+        cache = RENDER_CACHE
+    path = os.path.abspath(png)
+    entry = _render_index(cache)['figures'].get(path)
+    if entry is None or not os.path.exists(path):
+        return sorted(panels)
+    stat = os.stat(path)
+    if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+        return sorted(panels)
+    return sorted(name for name in panels
+                  if entry['panels'].get(name) != panels[name])
+
+
+def save_render(png, panels, cache=None):
+    '''Record the input hashes of a saved plot, see render_changes'''
+    if cache is None:
+        cache = RENDER_CACHE
+    index = _render_index(cache)
+    path = os.path.abspath(png)
+    stat = os.stat(path)
+    index['figures'][path] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                              'panels': panels}
+    if not os.path.isdir(os.path.dirname(cache)):
+        os.makedirs(os.path.dirname(cache))
+    tmp = '{}.{}.tmp'.format(cache, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, cache)
+
+
+def project_catalogs(patterns):
+    '''Catalog basenames (without .cat/.lin) of projects
+
+    Parameters
+    ----------
+    patterns : list
+        Catalog basenames or glob patterns, e.g. 'projects/*', matched
+        against the source catalogs (.cat)
+
+    Returns
+    -------
+    catalogs : list
+        Catalog basenames, in order and without duplicates
+    '''
+
+    catalogs = []
+    for pattern in patterns:
+        if pattern.endswith('.cat') or pattern.endswith('.lin'):
+            pattern = pattern[:-4]
+        matches = sorted(glob(pattern + '.cat'))
+        if not matches:
+            print('No catalogs found for', pattern)
+        for cat in matches:
+            if cat[:-4] not in catalogs:
+                catalogs.append(cat[:-4])
+    return catalogs
+
+
+def _plot_project(task):
+    '''Plot and save the apexlog plot of one project, see batch_projects'''
+    png, dfs, eso_id, pwv, kwargs = task
+    plt = pyplot()
+    fig = plot_apexlog(None, dfs, eso_id, pwv, **kwargs)
+    fig.savefig(png, bbox_inches='tight', dpi=120)
+    plt.close(fig)
+    return png
+
+
+def batch_projects(catalogs, df, outdir='.', jobs=1, tol=None, plot=True,
+                   replot=False, quantiles=None, decimate=True, profile=None):
+    '''Summarise and plot many projects from the same obslog data
+
+    The obslogs are read once (df), each project's catalogs are only
+    used to select its science scans. The summary of each project is
+    written to <project>.csv and its plot to <project>.png (if the plot
+    inputs changed, see render_changes), plotted in parallel processes
+    with jobs > 1.
+
+    Parameters
+    ----------
+    catalogs : list
+        Catalog basenames of the projects, see project_catalogs
+    df : pandas.DataFrame
+        The obslog data
+    outdir : string (optional)
+        Directory for the csv/png files
+    jobs : int (optional)
+        Plot in N processes, 0 for all CPUs
+    tol : float (optional)
+        Assign scans to catalog lines by frequency, within tol [GHz], see
+        catalogue_lines
+    plot : bool (optional)
+        Plot the projects, otherwise only write the summaries
+    replot : bool (optional)
+        Plot even if the plot inputs did not change
+    quantiles : list (optional)
+        As for plot_apexlog
+    decimate : bool (optional)
+        As for plot_apexlog
+    profile : StageProfile (optional)
+        Profile each project as a stage
+
+    Returns
+    -------
+    summaries : dict
+        Summary by science source/line by project
+    '''
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    pwv = pwv_series(df) if plot else None
+    kwargs = dict(quantiles=quantiles, decimate=decimate)
+    summaries, tasks, panels = {}, [], {}
+    for catalog in catalogs:
+        project = os.path.basename(catalog)
+        with profile_stage(profile, project):
+            print('\n\033[1;32m' + project + '\033[0m')
+            sci_sources = read_sourcecat(catalog)
+            sci_lines = read_linecat(catalog)
+            data = df
+            if tol is not None:
+                data = catalogue_lines(df, sci_lines, tol)
+            dfs = summarise_sciobs(sci_sources, sci_lines,
+                                   ScienceSelection(sci_sources, sci_lines,
+                                                    data))
+            print(dfs)
+            summaries[project] = dfs
+            dfs.to_csv(os.path.join(outdir, project + '.csv'))
+            if not plot:
+                continue
+            png = os.path.join(outdir, project + '.png')
+            panels[png] = figure_panels(dfs, pwv, plot_header(project.upper()),
+                                        quantiles, decimate)
+            changed = render_changes(png, panels[png])
+            if replot:
+                changed = sorted(panels[png])
+            if not changed:
+                print('\nPlot up to date:', png)
+            else:
+                print('\nPlotting {}, changed: {}'.format(
+                    png, ', '.join(changed)))
+                tasks.append((png, dfs, project.upper(), pwv, kwargs))
+
+    if tasks:
+        with profile_stage(profile, 'plot projects'):
+            if jobs != 1 and len(tasks) > 1:
+                pool = multiprocessing.Pool(jobs or None)
+                try:
+                    pngs = pool.map(_plot_project, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                pyplot().close('all')
+                pngs = [_plot_project(task) for task in tasks]
+            # recorded here, not by the plotting processes
+            for png in pngs:
+                save_render(png, panels[png])
+    return summaries
+
+
 def main():
-    plt.close('all')
-    catalogs, obslogs = parse_inputs()
-    if (catalogs is None) & (obslogs is None):
+    args = parse_inputs()
+    catalogs, obslogs = args.catalogs, args.obslogs
+    if args.batch:
+        eso_id = None
+    elif (catalogs is None) & (obslogs is None):
         eso_id = getuser()
         print('\033[1;32mDefaulting to APEX account:',
               '~/' + getuser() + '.[cat/lin] and ~/obslogs/\033[0m')
     else:
         eso_id = catalogs.split('/')[-1]
-    sci_sources = read_sourcecat(catalogs)
-    sci_lines = read_linecat(catalogs)
-    df = read_obslogs(obslogs)
-    dfs = summarise_sciobs(sci_sources, sci_lines, df)
+    sci_sources = sci_lines = None
+    if args.batch:
+        batch = project_catalogs(args.batch)
+        if not batch:
+            return None, None, None, None, None
+    else:
+        sci_sources = read_sourcecat(catalogs)
+        sci_lines = read_linecat(catalogs)
+    since, until = time_range(args.since, args.until, args.night)
+    if args.watch:
+        summary = ObslogSummary(
+            obslogs, ['source', 'line'],
+            partial(science_mask, sci_sources, sci_lines), since, until,
+            parser=args.parser, columns=REPORT_COLUMNS)
+
+        def show(summary):
+            print('\n' + time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'scan duration by science sources/lines:')
+            print(duration_minutes(summary.total()))
+
+        summary.watch(show, args.watch)
+        return sci_sources, sci_lines, None, None, None
+    read_kw = dict(cache=not args.no_cache, rebuild=args.rebuild_cache,
+                   jobs=args.jobs, parser=args.parser, compact=args.compact)
+    if not (args.all_columns or args.csv):
+        read_kw['columns'] = REPORT_COLUMNS
+    profile = None
+    if args.profile or args.profile_dump:
+        profile = StageProfile(cprofile=bool(args.profile_dump))
+        read_kw['profile'] = profile
+    with profile_stage(profile, 'read obslogs'):
+        if since is not None or until is not None:
+            # only the obslogs of the time range, not the whole store
+            if not find_obslogs(obslogs, since, until):
+                print('\nNo obslogs from', since, 'to', until)
+                return sci_sources, sci_lines, None, None, None
+            df = read_obslogs(obslogs, since=since, until=until, **read_kw)
+        else:
+            try:
+                if args.no_store:
+                    raise ImportError
+                df = update_store(args.store, obslogs, **read_kw)
+            except ImportError:
+                if not args.no_store:
+                    print('\npyarrow not installed, not using the obslog '
+                          'store')
+                df = read_obslogs(obslogs, **read_kw)
+    if args.batch:
+        tol = None if args.match_freq is None else args.match_freq / 1e3
+        with profile_stage(profile, 'batch projects'):
+            summaries = batch_projects(
+                batch, df, args.batch_dir, args.jobs, tol,
+                not args.no_plot, args.replot, args.pwv_quantiles,
+                not args.all_scans, profile)
+        if args.csv:
+            with profile_stage(profile, 'write ' + args.csv):
+                df.to_csv(args.csv)
+        report_profile(profile, args)
+        return None, None, df, summaries, None
+    if args.match_freq is not None:
+        with profile_stage(profile, 'match lines by frequency'):
+            df = catalogue_lines(df, sci_lines, args.match_freq / 1e3)
+    with profile_stage(profile, 'select science scans'):
+        science = ScienceSelection(sci_sources, sci_lines, df)
+    with profile_stage(profile, 'summarise_sciobs'):
+        dfs = summarise_sciobs(sci_sources, sci_lines, science)
     print(dfs)
     # plot_dfs(dfs)
-    fig = plot_apexlog(sci_sources, sci_lines, df, dfs, eso_id.upper())
-    fig.savefig('apexlog.png', bbox_inches='tight', dpi=120)
-    df.to_csv('apexlog.csv')
+    fig = None
+    if not args.no_plot:
+        with profile_stage(profile, 'hash plot inputs'):
+            pwv = pwv_series(df)
+            panels = figure_panels(dfs, pwv, plot_header(eso_id.upper()),
+                                   args.pwv_quantiles, not args.all_scans)
+            changed = render_changes('apexlog.png', panels)
+        if args.replot:
+            changed = sorted(panels)
+        if not changed:
+            print('\nPlot up to date: apexlog.png')
+        else:
+            print('\nPlotting apexlog.png, changed:', ', '.join(changed))
+            with profile_stage(profile, 'plot_apexlog'):
+                pyplot().close('all')
+                fig = plot_apexlog(df, dfs, eso_id.upper(), pwv,
+                                   quantiles=args.pwv_quantiles,
+                                   decimate=not args.all_scans)
+            with profile_stage(profile, 'save apexlog.png'):
+                fig.savefig('apexlog.png', bbox_inches='tight', dpi=120)
+                save_render('apexlog.png', panels)
+    if args.csv:
+        with profile_stage(profile, 'write ' + args.csv):
+            df.to_csv(args.csv)
+    report_profile(profile, args)
     return sci_sources, sci_lines, df, dfs, fig
 
 
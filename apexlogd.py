@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+''' apexlogd
+Resident obslog summary daemon for sumlogs.py (apex-html-logs.py).
+
+The daemon keeps the parsed obslogs in memory (apexlog.ObslogSummary),
+reads new scans as they arrive and answers summary queries over a Unix
+socket. The client side only needs the standard library, so querying a
+running daemon avoids the pandas start-up and the obslog parsing.
+'''
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import with_statement
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from os.path import expanduser
+
+SOCKET_DIR = expanduser('~/.cache/apexlog/')    # as apexlog.CACHE_DIR
+
+
+def socket_path(name='sumlogs'):
+    '''Unix socket of the daemon name on this host'''
+    return os.path.join(SOCKET_DIR,
+                        '{}-{}.sock'.format(name, socket.gethostname()))
+
+
+def query(path=None, source=None, timeout=10.):
+    '''Ask a running daemon for a scan duration summary
+
+    Parameters
+    ----------
+    path : string (optional)
+        Unix socket of the daemon, defaults to socket_path()
+    source : string (optional)
+        Summarise scans of this source by scan_status/line, otherwise all
+        scans by scan_status/source/line
+    timeout : float (optional)
+        Seconds to wait for the answer
+
+    Returns
+    -------
+    answer : dict or None
+        The summary as printable 'text', and 'names'/'rows' of the group
+        columns and duration [s]; None if no daemon answered
+    '''
+
+    if path is None:
+        path = socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps({'source': source}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            answer = json.loads(f.readline().decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    finally:
+        sock.close()
+    if 'error' in answer:
+        return None
+    return answer
+
+
+def _answer(summary, source):
+    '''Summary answer for a query, see query'''
+    dfs = summary.total()
+    if dfs is None:
+        return {'text': 'No obslogs', 'names': [], 'rows': []}
+    if source is not None:
+        sources = dfs.index.get_level_values('source')
+        dfs = dfs[sources == source].droplevel('source')
+    seconds = dfs.scan_duration.dt.total_seconds()
+    rows = [list(key if isinstance(key, tuple) else (key,)) + [value]
+            for key, value in zip(dfs.index, seconds)]
+    return {'text': str(dfs), 'names': list(dfs.index.names), 'rows': rows}
+
+
+def serve(path=None, dir=None, interval=10., **kwargs):
+    '''Run the summary daemon until interrupted
+
+    Parameters
+    ----------
+    path : string (optional)
+        Unix socket to listen on, defaults to socket_path()
+    dir : string (optional)
+        Directory with html log files, defaults to ~/obslogs/
+    interval : float (optional)
+        Seconds between polls of the obslogs while idle
+    **kwargs
+        Passed on to apexlog.ObslogSummary/read_one_log
+    '''
+
+    import apexlog
+    import socketserver
+
+    if path is None:
+        path = socket_path()
+    if query(path) is not None:
+        print('Summary daemon already running on', path)
+        return
+    if os.path.exists(path):
+        os.unlink(path)
+    elif not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    summary = apexlog.ObslogSummary(dir, **kwargs)
+    summary.update()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline().decode('utf-8'))
+                summary.update()
+                answer = _answer(summary, request.get('source'))
+            except Exception as e:
+                answer = {'error': repr(e)}
+            self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+    server = socketserver.UnixStreamServer(path, Handler)
+    os.chmod(path, 0o600)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server.timeout = interval
+    print('Serving obslog summaries on', path)
+    try:
+        while True:
+            t0 = time.time()
+            server.handle_request()
+            if time.time() - t0 >= interval:
+                summary.update()
+    except KeyboardInterrupt:
+        print('')
+    finally:
+        server.server_close()
+        os.unlink(path)